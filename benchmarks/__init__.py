@@ -0,0 +1,26 @@
+import os
+import tempfile
+
+# Benchmarks never reach real services, required settings get dummies.
+for name, value in {
+    "CELERY_BACKEND_URL": "cache+memory://",
+    "CELERY_BROKER_URL": "memory://",
+    "NEWSCATCHER_API_KEY": "benchmark",
+    "NEWSCATCHER_RATE_LIMIT": "100000",
+    "SPACY_MODEL_CORE": "en_core_web_sm",
+    "MONGO_COLLECTION_CLIENTS": "clients",
+    "MONGO_COLLECTION_NEWS": "news",
+    "MONGO_DB": "benchmark",
+    "MONGO_HOST": "localhost",
+    "MONGO_PORT": "27017",
+    "MONGO_USER": "benchmark",
+    "MONGO_PASSWORD": "benchmark",
+    "AWS_ACCESS_KEY_ID": "benchmark",
+    "AWS_SECRET_ACCESS_KEY": "benchmark",
+    "AWS_REGION": "us-east-1",
+    # Runs log outside the repository.
+    "PIPELINE_LOG_FILE": os.path.join(
+        tempfile.gettempdir(), "benchmarks", "pipeline.log"
+    ),
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,189 @@
+import json
+import random
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import boto3
+import httpx
+import mongomock
+from moto import mock_aws
+from pymongo import MongoClient
+
+from src.constants import (
+    AWS_REGION,
+    MONGO_COLLECTION_CLIENT_ARTICLES,
+    MONGO_COLLECTION_CONTENT,
+    MONGO_COLLECTION_NEWS,
+    MONGO_DB,
+)
+from src.db import MongoDBInit, article_hash, encode_content
+from src.dependencies import DependencyManager
+
+WORDS = (
+    "market shares bank rates growth profit loss report investors revenue "
+    "dividend merger guidance analysts demand inflation earnings outlook "
+    "quarter board company stock bond yield economy"
+).split()
+CODE_WORDS = ["Tesla", "Apple", "Nvidia", "Amazon", "Siemens", "Shell"]
+DOMAINS = [f"news{idx}.example.com" for idx in range(200)]
+
+
+def synthetic_article(code_word: str, idx: int, rng: random.Random) -> Dict:
+    """
+    Article shaped like an item of NewsCatcher `articles`. Equal
+    (code_word, idx) give the same title and link, so clients with the
+    same search share articles.
+    """
+    domain = DOMAINS[idx % len(DOMAINS)]
+    sentences = []
+    for _ in range(rng.randint(10, 40)):
+        words = rng.choices(WORDS, k=rng.randint(8, 20))
+        if rng.random() < 0.3:
+            words.insert(rng.randrange(len(words)), code_word)
+        sentences.append(" ".join(words).capitalize() + ".")
+    content = " ".join(sentences)
+    published = datetime(2024, 1, 1) + timedelta(minutes=idx)
+    headline = " ".join(WORDS[idx % 7 : idx % 7 + 5])
+    return {
+        "title": f"{code_word} {headline} {idx}",
+        "author": f"Author {idx % 50}",
+        "authors": [f"Author {idx % 50}"],
+        "published_date": published.strftime("%Y-%m-%d %H:%M:%S"),
+        "published_date_precision": "full",
+        "link": f"https://{domain}/{code_word.lower()}/{idx}",
+        "domain_url": domain,
+        "name_source": domain.split(".")[0],
+        "is_headline": idx % 10 == 0,
+        "language": "en",
+        "description": sentences[0],
+        "content": content,
+        "word_count": len(content.split()),
+        "rank": rng.randint(1, 100000),
+        "score": rng.random() * 10,
+        "id": article_hash(code_word, str(idx))[:32],
+    }
+
+
+def synthetic_articles(
+    count: int, code_word: str = "Tesla", seed: int = 0, offset: int = 0
+) -> List[Dict]:
+    rng = random.Random(seed)
+    return [
+        synthetic_article(code_word, idx, rng)
+        for idx in range(offset, offset + count)
+    ]
+
+
+def newscatcher_transport(
+    articles_per_search: int = 100,
+) -> httpx.MockTransport:
+    """
+    Stand-in for the NewsCatcher search API: every search has
+    `articles_per_search` articles split into pages.
+    """
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        params = request.url.params
+        page = int(params.get("page", 1))
+        page_size = int(params.get("page_size", 100))
+        start = (page - 1) * page_size
+        count = max(0, min(page_size, articles_per_search - start))
+        return httpx.Response(
+            200,
+            json={
+                "status": "ok",
+                "total_hits": articles_per_search,
+                "page": page,
+                "total_pages": -(-articles_per_search // page_size),
+                "page_size": page_size,
+                "articles": synthetic_articles(
+                    count, code_word=params["q"], seed=page, offset=start
+                ),
+            },
+        )
+
+    return httpx.MockTransport(handler)
+
+
+def mongo_connection(uri: Optional[str] = None) -> MongoDBInit:
+    """
+    MongoDBInit over mongomock, or over a local mongod when `uri` is set,
+    installed as the connection of DependencyManager.
+    """
+    mongo_client = MongoClient(uri) if uri else mongomock.MongoClient()
+    mongo_client.drop_database(MONGO_DB)
+    connection = MongoDBInit(mongo_client)
+    DependencyManager()._mongodb_connection = connection
+    return connection
+
+
+def insert_news(
+    connection: MongoDBInit, articles: List[Dict], client_id: str
+) -> None:
+    """
+    Prefill news of `client_id` the way check_or_add_news stores them:
+    metadata in the news collection, bodies in the content collection and
+    client-news edges.
+    """
+    now = datetime.utcnow()
+    news, contents, edges = [], [], []
+    for article in articles:
+        key = article_hash(article["title"], article["link"])
+        article = dict(article)
+        contents.append(
+            {
+                "_id": key,
+                **encode_content(article.pop("content", None)),
+                "created_at": now,
+            }
+        )
+        news.append(
+            {
+                "hash": key,
+                "article": article,
+                "created_at": now,
+                "nlp_status": "pending",
+            }
+        )
+        edges.append(
+            {
+                "client_id": client_id,
+                "hash": key,
+                "created_at": now,
+                "delivered": False,
+            }
+        )
+    connection.get_collection(MONGO_COLLECTION_CONTENT).insert_many(contents)
+    connection.get_collection(MONGO_COLLECTION_NEWS).insert_many(news)
+    connection.get_collection(MONGO_COLLECTION_CLIENT_ARTICLES).insert_many(
+        edges
+    )
+
+
+@contextmanager
+def aws_stubs(client_ids: List[str], bucket: str = "benchmark-news"):
+    """
+    moto stand-ins for Secrets Manager and S3 with an S3 secret for every
+    client.
+    """
+    with mock_aws():
+        DependencyManager()._boto3_secret_manager = None
+        boto3.client("s3", region_name=AWS_REGION).create_bucket(Bucket=bucket)
+        secrets = boto3.client("secretsmanager", region_name=AWS_REGION)
+        for client_id in client_ids:
+            secrets.create_secret(
+                Name=f"clients/{client_id}",
+                SecretString=json.dumps(
+                    {
+                        "access_key_id": "benchmark",
+                        "secret_access_key": "benchmark",
+                        "region": AWS_REGION,
+                        "bucket_name": bucket,
+                    }
+                ),
+            )
+        try:
+            yield
+        finally:
+            DependencyManager()._boto3_secret_manager = None
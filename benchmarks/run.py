@@ -0,0 +1,342 @@
+"""
+Offline benchmarks of the pipeline. NewsCatcher, MongoDB, Secrets
+Manager and S3 are replaced by local stand-ins; results are saved as JSON
+so that runs of different commits can be compared:
+
+    python -m benchmarks.run --output before.json
+    python -m benchmarks.run --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from benchmarks.fixtures import (
+    CODE_WORDS,
+    aws_stubs,
+    insert_news,
+    mongo_connection,
+    newscatcher_transport,
+    synthetic_articles,
+)
+from loguru import logger
+
+from src.constants import MONGO_COLLECTION_CLIENTS
+
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def measure(
+    name: str,
+    params: Dict,
+    run: Callable[[object], Optional[int]],
+    setup: Callable[[], object] = lambda: None,
+    repeat: int = 3,
+) -> Dict:
+    """
+    Time `run(setup())` `repeat` times. `run` may return the number of
+    items it handled to get a throughput.
+    """
+    seconds, items = [], None
+    for _ in range(repeat):
+        state = setup()
+        started_at = time.perf_counter()
+        items = run(state)
+        seconds.append(time.perf_counter() - started_at)
+
+    result = {
+        "name": name,
+        "params": params,
+        "repeat": repeat,
+        "min": min(seconds),
+        "median": statistics.median(seconds),
+        "max": max(seconds),
+    }
+    if items:
+        result["items_per_second"] = items / result["median"]
+    logger.info(f"{name} {params}: median {result['median']:.3f}s")
+    return result
+
+
+def skipped(name: str, params: Dict, reason: Exception) -> Dict:
+    logger.warning(f"{name} {params} skipped: {reason}")
+    return {"name": name, "params": params, "skipped": str(reason)}
+
+
+def bench_check_or_add_news(
+    mongo_uri: Optional[str], sizes: List[int], batch: int, repeat: int
+) -> List[Dict]:
+    """
+    Upsert of one NewsCatcher response (half new, half existing
+    articles) into a collection of `size` news.
+    """
+    from src.utils import MongoDBServices
+
+    results = []
+    for size in sizes:
+        existing = synthetic_articles(size)
+        response = synthetic_articles(batch, offset=size - batch // 2)
+
+        def setup():
+            connection = mongo_connection(mongo_uri)
+            connection.setup_indexes()
+            insert_news(connection, existing, "client_0")
+            return MongoDBServices(connection)
+
+        results.append(
+            measure(
+                "check_or_add_news",
+                {"existing": size, "batch": batch},
+                lambda services: len(
+                    services.check_or_add_news("client_1", response)
+                ),
+                setup=setup,
+                repeat=repeat,
+            )
+        )
+    return results
+
+
+def bench_get_clients_news(
+    mongo_uri: Optional[str], sizes: List[int], repeat: int
+) -> List[Dict]:
+    from src.utils import MongoDBServices
+
+    results = []
+    for size in sizes:
+        connection = mongo_connection(mongo_uri)
+        connection.setup_indexes()
+        insert_news(connection, synthetic_articles(size), "client_0")
+        services = MongoDBServices(connection)
+        results.append(
+            measure(
+                "get_clients_news",
+                {"articles": size},
+                lambda _: len(services.get_clients_news("client_0", nlp=True)),
+                repeat=repeat,
+            )
+        )
+    return results
+
+
+def bench_handle_articles(
+    mongo_uri: Optional[str], sizes: List[int], repeat: int
+) -> List[Dict]:
+    """
+    Segmentation and sentiment of `size` articles, needs spaCy and the
+    FinBERT model. The sentiment cache is off, every run infers.
+    """
+    results = []
+    for size in sizes:
+        params = {"articles": size}
+        try:
+            from src.tasks_handlers import NlpProcesData
+            from src.utils import DefineSentiment, MongoDBServices
+
+            sentiment_service = DefineSentiment(use_cache=False)
+        except (ImportError, OSError) as e:
+            results.append(skipped("handle_articles", params, e))
+            continue
+
+        def setup():
+            connection = mongo_connection(mongo_uri)
+            connection.setup_indexes()
+            insert_news(connection, synthetic_articles(size), "client_0")
+            handler = NlpProcesData(
+                clients_news=MongoDBServices(connection).get_pending_news(
+                    client_id="client_0"
+                ),
+                code_word=CODE_WORDS[0],
+                client_id="client_0",
+            )
+            handler.sentiment_service = sentiment_service
+            return handler
+
+        results.append(
+            measure(
+                "handle_articles",
+                params,
+                lambda handler: handler.handle_articles() or size,
+                setup=setup,
+                repeat=repeat,
+            )
+        )
+    return results
+
+
+def bench_run_task_chain(
+    mongo_uri: Optional[str],
+    sizes: List[int],
+    articles_per_search: int,
+    repeat: int,
+) -> List[Dict]:
+    """
+    Eager run of the whole chain for `size` clients without NLP, pairs of
+    clients share their search. Delivery goes to a moto S3 bucket.
+    """
+    from src.celery_conf import celery_app
+    from src.tasks import run_task_chain
+    from src.tasks_handlers import SendingStrategyFactory
+    from src.utils import AsyncNewsCatcherFetcher
+
+    celery_app.conf.task_always_eager = True
+    celery_app.conf.task_eager_propagates = True
+    AsyncNewsCatcherFetcher().transport = newscatcher_transport(
+        articles_per_search
+    )
+
+    results = []
+    for size in sizes:
+        clients = [
+            {
+                "client": f"client_{idx}",
+                "nlp": False,
+                "send_to": "s3_path",
+                "cron": "* * * * *",
+                "newscatcher_params": {
+                    "q": CODE_WORDS[(idx // 2) % len(CODE_WORDS)],
+                    "sources": [f"source{idx // 2}.example.com"],
+                },
+            }
+            for idx in range(size)
+        ]
+
+        def setup():
+            connection = mongo_connection(mongo_uri)
+            connection.setup_indexes()
+            client_ids = [
+                str(client_id)
+                for client_id in connection.get_collection(
+                    MONGO_COLLECTION_CLIENTS
+                )
+                .insert_many([dict(client) for client in clients])
+                .inserted_ids
+            ]
+            SendingStrategyFactory._cache.clear()
+            return client_ids
+
+        def run(client_ids):
+            with aws_stubs(client_ids):
+                for client_id in client_ids:
+                    run_task_chain.apply(kwargs={"client_id": client_id})
+            return len(client_ids)
+
+        results.append(
+            measure(
+                "run_task_chain",
+                {"clients": size, "articles_per_search": articles_per_search},
+                run,
+                setup=setup,
+                repeat=repeat,
+            )
+        )
+    return results
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], text=True
+        ).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results: List[Dict], baseline_path: str) -> None:
+    with open(baseline_path, "r") as file:
+        baseline = {
+            (item["name"], json.dumps(item["params"], sort_keys=True)): item
+            for item in json.load(file)["results"]
+        }
+    for item in results:
+        key = (item["name"], json.dumps(item["params"], sort_keys=True))
+        before = baseline.get(key)
+        if not before or "median" not in before or "median" not in item:
+            continue
+        ratio = item["median"] / before["median"]
+        logger.info(
+            f"{item['name']} {item['params']}: {before['median']:.3f}s -> "
+            f"{item['median']:.3f}s ({ratio:.2f}x)"
+        )
+
+
+def parse_sizes(value: str) -> List[int]:
+    return [int(size) for size in value.split(",") if size]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--mongo-uri",
+        help="local mongod to use instead of mongomock (its database "
+        "is dropped)",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--only",
+        help="comma separated benchmarks: check_or_add_news, "
+        "get_clients_news, handle_articles, run_task_chain",
+    )
+    parser.add_argument(
+        "--existing", type=parse_sizes, default=[1000, 10000, 100000]
+    )
+    parser.add_argument("--response-size", type=int, default=100)
+    parser.add_argument("--news", type=parse_sizes, default=[100, 1000, 10000])
+    parser.add_argument("--nlp-articles", type=parse_sizes, default=[10, 100])
+    parser.add_argument("--clients", type=parse_sizes, default=[1, 10, 50])
+    parser.add_argument("--output", help="results file")
+    parser.add_argument("--compare", help="results file of a previous run")
+    args = parser.parse_args()
+
+    only = set(args.only.split(",")) if args.only else None
+    benchmarks = {
+        "check_or_add_news": lambda: bench_check_or_add_news(
+            args.mongo_uri, args.existing, args.response_size, args.repeat
+        ),
+        "get_clients_news": lambda: bench_get_clients_news(
+            args.mongo_uri, args.news, args.repeat
+        ),
+        "handle_articles": lambda: bench_handle_articles(
+            args.mongo_uri, args.nlp_articles, args.repeat
+        ),
+        "run_task_chain": lambda: bench_run_task_chain(
+            args.mongo_uri, args.clients, args.response_size, args.repeat
+        ),
+    }
+    results = []
+    for name, bench in benchmarks.items():
+        if only is None or name in only:
+            results.extend(bench())
+
+    commit = git_commit()
+    output = args.output or os.path.join(
+        RESULTS_DIR,
+        f"{datetime.utcnow():%Y%m%dT%H%M%S}-{commit or 'unknown'}.json",
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as file:
+        json.dump(
+            {
+                "commit": commit,
+                "created_at": datetime.utcnow().isoformat(),
+                "python": platform.python_version(),
+                "mongo": "mongod" if args.mongo_uri else "mongomock",
+                "results": results,
+            },
+            file,
+            indent=2,
+        )
+    logger.info(f"Benchmark results saved to '{output}'.")
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
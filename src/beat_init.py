@@ -1,8 +1,12 @@
+from datetime import datetime, timezone
+
 from celery.schedules import crontab
 from loguru import logger
 
 from src.celery_conf import AppCeleryConfig, celery_app
-from src.db import MongoDBInit
+from src.constants import DISPATCH_MISFIRE_GRACE
+from src.dependencies import DependencyManager
+from src.scheduling import sync_clients_schedule
 from src.utils import MongoDBServices
 
 
@@ -10,49 +14,28 @@ from src.utils import MongoDBServices
 def setup_periodic_tasks(sender: AppCeleryConfig, **kwargs) -> None:
     logger.info("Connecting to the database from beat...")
 
-    with MongoDBInit() as connection:
-        try:
-            connection.connect()
-            connection.load_data_from_json("clients.json")
-        except Exception:
-            logger.warning("Client`s data already exist.")
-
-        schedule_data = MongoDBServices(
-            connection=connection
-        ).get_all_clients()
-
-    for client in schedule_data:
-        update_schedule_from_db(sender, client)
-        logger.info(
-            f"Schedule for client_id '{client['_id']}' updated success."
-        )
-
-
-def update_schedule_from_db(
-    sender: AppCeleryConfig, client_data: dict
-) -> None:
-    schedule = sender.conf.beat_schedule.copy()
-
-    task_name = f"task_for_{client_data['_id']}"
-    cron_args = parse_cron_string(client_data["cron"])
-    schedule[task_name] = {
-        "task": "clients_pipeline.tasks.run_task_chain",
-        "schedule": crontab(**cron_args),
-        "kwargs": {"client_id": str(client_data["_id"])},
-    }
-    sender.conf.beat_schedule = schedule
-
-
-def parse_cron_string(cron_str: str) -> dict:
+    connection = DependencyManager().mongodb_connection
+    connection.setup_indexes()
     try:
-        minute, hour, day_of_month, month, day_of_week = cron_str.split()
-        return {
-            "minute": minute,
-            "hour": hour,
-            "day_of_month": day_of_month,
-            "month_of_year": month,
-            "day_of_week": day_of_week,
+        connection.load_data_from_json("clients.json")
+    except Exception:
+        logger.warning("Client`s data not loaded from json.")
+
+    sync_clients_schedule(
+        MongoDBServices(connection=connection),
+        now=datetime.now(timezone.utc),
+    )
+
+    # One dispatcher entry per minute instead of one entry per client: each
+    # tick applies client changes and enqueues the chains of due clients,
+    # so schedule changes never need a beat restart. A tick may wait for
+    # the dispatcher up to the misfire grace: a run delayed that long is
+    # dispatched late, while after the grace the dispatcher counts as down.
+    sender.conf.beat_schedule = {
+        "dispatch_due_clients": {
+            "task": "dispatch_due_clients",
+            "schedule": crontab(),
+            "options": {"expires": max(60, DISPATCH_MISFIRE_GRACE)},
         }
-    except Exception as e:
-        logger.error(f"Error parsing cron string {cron_str}: {e}")
-        raise
+    }
+    logger.info("Schedule dispatcher of clients pipelines set up success.")
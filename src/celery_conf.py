@@ -57,7 +57,8 @@ class BaseCeleryConfig:
 
 class AppCeleryConfig(BaseCeleryConfig):
     worker_prefetch_multiplier = 1  # For local start
-    worker_concurrency = 1  # For local start
+    # For local start, workers in docker-compose set it with `-c`.
+    worker_concurrency = 1
 
 
 def create_celery_app(name, config_class, task_routes) -> Celery:
@@ -85,8 +86,13 @@ celery_app = create_celery_app(
     AppCeleryConfig,
     {
         "clients_pipeline.tasks.run_task_chain": {"queue": "io-worker"},
+        # Ticks never wait behind fetch tasks of the io-worker.
+        "dispatch_due_clients": {"queue": "dispatcher"},
         "newscatcher_hook": {"queue": "io-worker"},
         "ml_process_news_data": {"queue": "cpu-worker"},
         "send_data": {"queue": "sender-worker"},
+        "newscatcher_batch": {"queue": "io-worker"},
+        "ml_process_news_batch": {"queue": "cpu-worker"},
+        "send_data_batch": {"queue": "sender-worker"},
     },
 )
@@ -7,17 +7,101 @@ env.read_env()
 
 CELERY_BACKEND_URL: Final = env.str("CELERY_BACKEND_URL")
 CELERY_BROKER_URL: Final = env.str("CELERY_BROKER_URL")
+PIPELINE_LOG_FILE: Final = env.str("PIPELINE_LOG_FILE", "logging/pipeline.log")
+DISPATCH_MAX_CLIENTS: Final = env.int("DISPATCH_MAX_CLIENTS", 1000)
+DISPATCH_MISFIRE_GRACE: Final = env.int("DISPATCH_MISFIRE_GRACE", 300)
+PIPELINE_BATCH_MODE: Final = env.bool("PIPELINE_BATCH_MODE", False)
+PIPELINE_BATCH_SIZE: Final = env.int("PIPELINE_BATCH_SIZE", 50)
 NEWSCATCHER_API_KEY: Final = env.str("NEWSCATCHER_API_KEY")
+NEWSCATCHER_CONCURRENCY: Final = env.int("NEWSCATCHER_CONCURRENCY", 4)
+NEWSCATCHER_RATE_LIMIT: Final = env.float("NEWSCATCHER_RATE_LIMIT", 5.0)
+NEWSCATCHER_PAGE_SIZE: Final = env.int("NEWSCATCHER_PAGE_SIZE", 100)
+NEWSCATCHER_MAX_PAGES: Final = env.int("NEWSCATCHER_MAX_PAGES", 100)
+NEWSCATCHER_MAX_RETRIES: Final = env.int("NEWSCATCHER_MAX_RETRIES", 5)
+NEWSCATCHER_SOURCES_SHARD_SIZE: Final = env.int(
+    "NEWSCATCHER_SOURCES_SHARD_SIZE", 100
+)
+NEWSCATCHER_CACHE_BUCKET: Final = env.int("NEWSCATCHER_CACHE_BUCKET", 900)
+NEWSCATCHER_CACHE_WAIT: Final = env.int("NEWSCATCHER_CACHE_WAIT", 120)
 SPACY_MODEL_CORE: Final = env.str("SPACY_MODEL_CORE")
+SPACY_FAST_SEGMENTATION: Final = env.bool("SPACY_FAST_SEGMENTATION", True)
+SPACY_PIPE_BATCH_SIZE: Final = env.int("SPACY_PIPE_BATCH_SIZE", 64)
+CODE_WORD_WINDOW_SIZE: Final = env.int("CODE_WORD_WINDOW_SIZE", 1000)
+NEAR_DUPLICATES_ENABLED: Final = env.bool("NEAR_DUPLICATES_ENABLED", True)
+NEAR_DUPLICATES_DISTANCE: Final = env.int("NEAR_DUPLICATES_DISTANCE", 3)
+NEAR_DUPLICATES_BANDS: Final = env.int("NEAR_DUPLICATES_BANDS", 4)
+
+SENTIMENT_BATCH_SIZE: Final = env.int("SENTIMENT_BATCH_SIZE", 32)
+SENTIMENT_SORT_BY_LENGTH: Final = env.bool("SENTIMENT_SORT_BY_LENGTH", True)
+INFERENCE_ENGINE_ENABLED: Final = env.bool("INFERENCE_ENGINE_ENABLED", False)
+INFERENCE_MAX_BATCH_SIZE: Final = env.int("INFERENCE_MAX_BATCH_SIZE", 128)
+INFERENCE_MAX_WAIT_MS: Final = env.int("INFERENCE_MAX_WAIT_MS", 20)
+TORCH_NUM_THREADS: Final = env.int("TORCH_NUM_THREADS", 0)
+TORCH_INTEROP_THREADS: Final = env.int("TORCH_INTEROP_THREADS", 0)
+SENTIMENT_MODEL_REVISION: Final = env.str("SENTIMENT_MODEL_REVISION", "main")
+SENTIMENT_BACKEND: Final = env.str("SENTIMENT_BACKEND", "pytorch")
+SENTIMENT_PARITY_CHECK: Final = env.bool("SENTIMENT_PARITY_CHECK", True)
+SENTIMENT_PARITY_THRESHOLD: Final = env.float(
+    "SENTIMENT_PARITY_THRESHOLD", 0.95
+)
+MODEL_CACHE_DIR: Final = env.str("MODEL_CACHE_DIR", "models")
+MODEL_VERIFY_INTEGRITY: Final = env.bool("MODEL_VERIFY_INTEGRITY", True)
+SENTIMENT_CACHE_ENABLED: Final = env.bool("SENTIMENT_CACHE_ENABLED", True)
+SENTIMENT_CACHE_SIZE: Final = env.int("SENTIMENT_CACHE_SIZE", 100_000)
+SENTIMENT_CACHE_TTL_DAYS: Final = env.int("SENTIMENT_CACHE_TTL_DAYS", 90)
 
 MONGO_COLLECTION_CLIENTS: Final = env.str("MONGO_COLLECTION_CLIENTS")
+MONGO_COLLECTION_CLIENT_ARTICLES: Final = env.str(
+    "MONGO_COLLECTION_CLIENT_ARTICLES", "client_articles"
+)
+MONGO_COLLECTION_DELIVERIES: Final = env.str(
+    "MONGO_COLLECTION_DELIVERIES", "deliveries"
+)
 MONGO_COLLECTION_NEWS: Final = env.str("MONGO_COLLECTION_NEWS")
+MONGO_COLLECTION_CONTENT: Final = env.str(
+    "MONGO_COLLECTION_CONTENT", "news_content"
+)
+MONGO_COLLECTION_SCHEDULER: Final = env.str(
+    "MONGO_COLLECTION_SCHEDULER", "scheduler_state"
+)
+MONGO_COLLECTION_METRICS: Final = env.str(
+    "MONGO_COLLECTION_METRICS", "pipeline_metrics"
+)
+MONGO_COLLECTION_FETCH_CACHE: Final = env.str(
+    "MONGO_COLLECTION_FETCH_CACHE", "newscatcher_cache"
+)
+MONGO_COLLECTION_SENTIMENT_CACHE: Final = env.str(
+    "MONGO_COLLECTION_SENTIMENT_CACHE", "sentence_sentiments"
+)
 MONGO_DB: Final = env.str("MONGO_DB")
 MONGO_HOST: Final = env.str("MONGO_HOST")
 MONGO_PORT: Final = env.str("MONGO_PORT")
 MONGO_USER: Final = env.str("MONGO_USER")
 MONGO_PASSWORD: Final = env.str("MONGO_PASSWORD")
+MONGO_BULK_FLUSH_SIZE: Final = env.int("MONGO_BULK_FLUSH_SIZE", 500)
+MONGO_NEWS_TTL_DAYS: Final = env.int("MONGO_NEWS_TTL_DAYS", 30)
+MONGO_STREAM_BATCH_SIZE: Final = env.int("MONGO_STREAM_BATCH_SIZE", 500)
+MONGO_CONTENT_COMPRESS_SIZE: Final = env.int(
+    "MONGO_CONTENT_COMPRESS_SIZE", 16 * 1024
+)
+MONGO_MAX_POOL_SIZE: Final = env.int("MONGO_MAX_POOL_SIZE", 20)
+MONGO_MIN_POOL_SIZE: Final = env.int("MONGO_MIN_POOL_SIZE", 0)
+MONGO_MAX_IDLE_TIME_MS: Final = env.int("MONGO_MAX_IDLE_TIME_MS", 300000)
 
 AWS_ACCESS_KEY_ID: Final = env.str("AWS_ACCESS_KEY_ID")
 AWS_SECRET_ACCESS_KEY: Final = env.str("AWS_SECRET_ACCESS_KEY")
 AWS_REGION: Final = env.str("AWS_REGION")
+
+DELIVERY_DELTA_ENABLED: Final = env.bool("DELIVERY_DELTA_ENABLED", True)
+SENDING_STRATEGY_CACHE_TTL: Final = env.int("SENDING_STRATEGY_CACHE_TTL", 900)
+S3_MULTIPART_CHUNK_SIZE: Final = env.int(
+    "S3_MULTIPART_CHUNK_SIZE", 8 * 1024 * 1024
+)
+SQS_MAX_MESSAGE_SIZE: Final = 256 * 1024
+PUBSUB_MAX_MESSAGE_SIZE: Final = env.int(
+    "PUBSUB_MAX_MESSAGE_SIZE", 8 * 1024 * 1024
+)
+
+METRICS_ENABLED: Final = env.bool("METRICS_ENABLED", True)
+METRICS_PORT: Final = env.int("METRICS_PORT", 9100)
+METRICS_TTL_DAYS: Final = env.int("METRICS_TTL_DAYS", 14)
@@ -1,23 +1,214 @@
+import hashlib
+import itertools
 import json
+import os
+import threading
+import zlib
+from datetime import datetime
+from typing import Callable, Dict, Iterable, List, Optional
 
+from bson import Binary
 from loguru import logger
-from pymongo import ASCENDING, MongoClient
+from pymongo import ASCENDING, MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, OperationFailure
+from pymongo.monitoring import ConnectionPoolListener
 
 from src.constants import (
+    METRICS_TTL_DAYS,
+    MONGO_COLLECTION_CLIENT_ARTICLES,
     MONGO_COLLECTION_CLIENTS,
+    MONGO_COLLECTION_CONTENT,
+    MONGO_COLLECTION_DELIVERIES,
+    MONGO_COLLECTION_FETCH_CACHE,
+    MONGO_COLLECTION_METRICS,
     MONGO_COLLECTION_NEWS,
+    MONGO_COLLECTION_SENTIMENT_CACHE,
+    MONGO_CONTENT_COMPRESS_SIZE,
     MONGO_DB,
     MONGO_HOST,
+    MONGO_MAX_IDLE_TIME_MS,
+    MONGO_MAX_POOL_SIZE,
+    MONGO_MIN_POOL_SIZE,
+    MONGO_NEWS_TTL_DAYS,
     MONGO_PASSWORD,
     MONGO_PORT,
     MONGO_USER,
+    NEWSCATCHER_CACHE_BUCKET,
+    SENTIMENT_CACHE_TTL_DAYS,
 )
 
 
-class MongoDBInit:
+def article_hash(title: str, link: str) -> str:
+    """
+    Stable identity of a news article used as the deduplication key.
+    """
+    return hashlib.sha256(f"{title}\x1f{link}".encode("utf-8")).hexdigest()
+
+
+def encode_content(content: Optional[str]) -> Dict:
+    """
+    Fields of a content document: long bodies are stored zlib-compressed.
+    """
+    data = (content or "").encode("utf-8")
+    threshold = MONGO_CONTENT_COMPRESS_SIZE
+    if threshold and len(data) >= threshold:
+        return {"content": Binary(zlib.compress(data)), "compression": "zlib"}
+    return {"content": content}
+
+
+def decode_content(doc: Dict) -> Optional[str]:
+    if doc.get("compression") == "zlib":
+        return zlib.decompress(doc["content"]).decode("utf-8")
+    return doc.get("content")
+
+
+def client_article_operations(
+    client_ids: List[str], hashes: List[str], now: datetime
+) -> List[UpdateOne]:
+    return [
+        UpdateOne(
+            {"client_id": client_id, "hash": key},
+            {"$setOnInsert": {"created_at": now, "delivered": False}},
+            upsert=True,
+        )
+        for client_id in client_ids
+        for key in hashes
+    ]
+
+
+def content_operations(
+    contents: Dict[str, Optional[str]], now: datetime
+) -> List[UpdateOne]:
+    return [
+        UpdateOne(
+            {"_id": key},
+            {"$setOnInsert": {**encode_content(content), "created_at": now}},
+            upsert=True,
+        )
+        for key, content in contents.items()
+    ]
+
+
+def bulk_upsert(collection, operations: List[UpdateOne]) -> List[int]:
+    """
+    Unordered bulk of `$setOnInsert` upserts. Returns indexes of the
+    operations that inserted a document.
+    """
+    if not operations:
+        return []
+    try:
+        result = collection.bulk_write(operations, ordered=False)
+        return sorted(result.upserted_ids)
+    except BulkWriteError as bwe:
+        # Duplicate keys only mean another worker inserted it first.
+        errors = [
+            error
+            for error in bwe.details["writeErrors"]
+            if error["code"] != 11000
+        ]
+        if errors:
+            logger.error(f"Bulk write error: {errors}")
+        return [upserted["index"] for upserted in bwe.details["upserted"]]
+
+
+def migrate_in_batches(
+    docs: Iterable[dict],
+    migrate: Callable[[List[dict]], None],
+    batch_size: int,
+) -> int:
+    """
+    Call `migrate` with consecutive batches of `docs`, returns the number
+    of migrated documents.
+    """
+    docs, migrated = iter(docs), 0
+    while True:
+        batch = list(itertools.islice(docs, batch_size))
+        if not batch:
+            return migrated
+        migrate(batch)
+        migrated += len(batch)
+
+
+class PoolStatsListener(ConnectionPoolListener):
+    """
+    Counts connection pool events of one MongoClient.
+    """
+
     def __init__(self):
+        self._lock = threading.Lock()
+        self._stats = dict.fromkeys(
+            (
+                "created",
+                "closed",
+                "checked_out",
+                "checked_in",
+                "check_out_failed",
+                "pool_cleared",
+            ),
+            0,
+        )
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._stats[name] += 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+        stats["open"] = stats["created"] - stats["closed"]
+        stats["in_use"] = stats["checked_out"] - stats["checked_in"]
+        return stats
+
+    def pool_created(self, event) -> None:
+        pass
+
+    def pool_ready(self, event) -> None:
+        pass
+
+    def pool_cleared(self, event) -> None:
+        self._count("pool_cleared")
+
+    def pool_closed(self, event) -> None:
+        pass
+
+    def connection_created(self, event) -> None:
+        self._count("created")
+
+    def connection_ready(self, event) -> None:
+        pass
+
+    def connection_closed(self, event) -> None:
+        self._count("closed")
+
+    def connection_check_out_started(self, event) -> None:
+        pass
+
+    def connection_check_out_failed(self, event) -> None:
+        self._count("check_out_failed")
+
+    def connection_checked_out(self, event) -> None:
+        self._count("checked_out")
+
+    def connection_checked_in(self, event) -> None:
+        self._count("checked_in")
+
+
+class MongoDBInit:
+    """
+    One pooled MongoClient per process. A client inherited through fork
+    is replaced by a new one on the next `connect`, the child never uses
+    sockets of its parent.
+    """
+
+    def __init__(self, mongo_client: Optional[MongoClient] = None):
         self._mongo_client = None
         self._db = None
+        self._pid = None
+        self._pool_listener = PoolStatsListener()
+        if mongo_client is not None:
+            self._mongo_client = mongo_client
+            self._db = mongo_client[MONGO_DB]
+            self._pid = os.getpid()
 
     def __enter__(self):
         self.connect()
@@ -29,37 +220,330 @@ class MongoDBInit:
             logger.error(f"An error in MongoDBInit occurred: {exc_val}")
 
     def connect(self) -> MongoClient:
+        if self._mongo_client and self._pid != os.getpid():
+            # Not closed: that would also shut the parent's sockets down.
+            logger.info("MongoDB connection inherited by fork, reconnecting.")
+            self._mongo_client = None
+            self._pool_listener = PoolStatsListener()
         if not self._mongo_client:
             MONGODB_URL = f"mongodb://{MONGO_USER}:{MONGO_PASSWORD}@{MONGO_HOST}:{MONGO_PORT}"
-            self._mongo_client = MongoClient(MONGODB_URL)
+            self._mongo_client = MongoClient(
+                MONGODB_URL,
+                maxPoolSize=MONGO_MAX_POOL_SIZE,
+                minPoolSize=MONGO_MIN_POOL_SIZE,
+                maxIdleTimeMS=MONGO_MAX_IDLE_TIME_MS or None,
+                event_listeners=[self._pool_listener],
+            )
             self._db = self._mongo_client[MONGO_DB]
-            self.setup_indexes()
+            self._pid = os.getpid()
             logger.info("MongoDB connection initialized successfully.")
         return self._mongo_client
 
+    def pool_stats(self) -> Dict[str, int]:
+        return self._pool_listener.stats()
+
     def setup_indexes(self):
+        """
+        Create indexes of all collections. Runs once at deploy (beat
+        startup or `python -m src.db`), not on every connect.
+        """
         clients_collection = self._db[MONGO_COLLECTION_CLIENTS]
         clients_collection.create_index([("client", ASCENDING)], unique=True)
+        clients_collection.create_index([("next_run_at", ASCENDING)])
+        clients_collection.create_index([("updated_at", ASCENDING)])
+
+        news_collection = self._db[MONGO_COLLECTION_NEWS]
+        if "source_1" in news_collection.index_information():
+            news_collection.drop_index("source_1")
+        self.setup_ttl_index(news_collection, days=MONGO_NEWS_TTL_DAYS)
+        self.setup_ttl_index(
+            self._db[MONGO_COLLECTION_CONTENT], days=MONGO_NEWS_TTL_DAYS
+        )
+        self.backfill_nlp_status()
+        # SimHash band buckets of near duplicates and their clusters.
+        news_collection.create_index([("simhash_bands", ASCENDING)])
+        if "cluster_id_1_nlp_status_1" in news_collection.index_information():
+            news_collection.drop_index("cluster_id_1_nlp_status_1")
+        news_collection.create_index(
+            [
+                ("cluster_id", ASCENDING),
+                ("nlp_code_word", ASCENDING),
+                ("nlp_status", ASCENDING),
+            ]
+        )
+
+        # Client-news edges: daily news of a client are a range scan of
+        # (client_id, created_at), delivery digests live on the edge.
+        client_articles_collection = self._db[MONGO_COLLECTION_CLIENT_ARTICLES]
+        client_articles_collection.create_index(
+            [("client_id", ASCENDING), ("hash", ASCENDING)], unique=True
+        )
+        client_articles_collection.create_index(
+            [("client_id", ASCENDING), ("created_at", ASCENDING)]
+        )
+        self.setup_ttl_index(
+            client_articles_collection, days=MONGO_NEWS_TTL_DAYS
+        )
+
+        fetch_cache_collection = self._db[MONGO_COLLECTION_FETCH_CACHE]
+        fetch_cache_collection.create_index(
+            [("created_at", ASCENDING)],
+            expireAfterSeconds=2 * NEWSCATCHER_CACHE_BUCKET,
+        )
 
+        self.setup_ttl_index(
+            self._db[MONGO_COLLECTION_SENTIMENT_CACHE],
+            days=SENTIMENT_CACHE_TTL_DAYS,
+        )
+
+        metrics_collection = self._db[MONGO_COLLECTION_METRICS]
+        metrics_collection.create_index(
+            [("stage", ASCENDING), ("client_id", ASCENDING)]
+        )
+        self.setup_ttl_index(metrics_collection, days=METRICS_TTL_DAYS)
+
+        self.backfill_news_hashes()
+        try:
+            news_collection.create_index(
+                [("hash", ASCENDING)],
+                unique=True,
+                partialFilterExpression={"hash": {"$exists": True}},
+            )
+        except OperationFailure as e:
+            logger.error(f"Unique index on news hash not created: {e}")
+        self.migrate_news_content()
+        self.migrate_client_articles()
+
+    @staticmethod
+    def setup_ttl_index(collection, days: int) -> None:
+        """
+        Expire documents by `created_at` after `days`, 0 disables expiry.
+        """
+        index_name = "created_at_ttl"
+        indexes = collection.index_information()
+        if not days:
+            if index_name in indexes:
+                collection.drop_index(index_name)
+            return
+
+        expire_after = days * 24 * 60 * 60
+        if index_name not in indexes:
+            collection.create_index(
+                [("created_at", ASCENDING)],
+                name=index_name,
+                expireAfterSeconds=expire_after,
+            )
+        elif indexes[index_name].get("expireAfterSeconds") != expire_after:
+            collection.database.command(
+                "collMod",
+                collection.name,
+                index={"name": index_name, "expireAfterSeconds": expire_after},
+            )
+        logger.info(
+            f"Documents of '{collection.name}' expire after {days} days."
+        )
+
+    def backfill_news_hashes(self, batch_size: int = 1000) -> None:
+        news_collection = self._db[MONGO_COLLECTION_NEWS]
+        cursor = news_collection.find(
+            {"hash": {"$exists": False}},
+            {"article.title": 1, "article.link": 1},
+        )
+
+        def migrate(docs: List[dict]) -> None:
+            operations = []
+            for doc in docs:
+                article = doc.get("article", {})
+                operations.append(
+                    UpdateOne(
+                        {"_id": doc["_id"]},
+                        {
+                            "$set": {
+                                "hash": article_hash(
+                                    article.get("title"), article.get("link")
+                                )
+                            }
+                        },
+                    )
+                )
+            news_collection.bulk_write(operations, ordered=False)
+
+        migrate_in_batches(cursor, migrate, batch_size)
+
+    def migrate_news_content(self, batch_size: int = 1000) -> None:
+        """
+        Move article bodies embedded in news documents to the content
+        collection.
+        """
+        news_collection = self._db[MONGO_COLLECTION_NEWS]
+        content_collection = self._db[MONGO_COLLECTION_CONTENT]
+        cursor = news_collection.find(
+            {"article.content": {"$exists": True}, "hash": {"$exists": True}},
+            {"hash": 1, "article.content": 1, "created_at": 1},
+        )
+
+        def migrate(docs: List[dict]) -> None:
+            # Bodies are written before they are removed from the news,
+            # and keep the news creation time so both expire together.
+            bulk_upsert(
+                content_collection,
+                [
+                    operation
+                    for doc in docs
+                    for operation in content_operations(
+                        {doc["hash"]: doc["article"]["content"]},
+                        doc.get("created_at") or datetime.utcnow(),
+                    )
+                ],
+            )
+            news_collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"_id": doc["_id"]},
+                        {"$unset": {"article.content": ""}},
+                    )
+                    for doc in docs
+                ],
+                ordered=False,
+            )
+
+        moved = migrate_in_batches(cursor, migrate, batch_size)
+        if moved:
+            logger.info(f"Bodies of {moved} news moved to content collection.")
+
+    def migrate_client_articles(self, batch_size: int = 1000) -> None:
+        """
+        Move `clients` arrays of news and the deliveries collection to
+        client-news edges.
+        """
         news_collection = self._db[MONGO_COLLECTION_NEWS]
-        news_collection.create_index([("source", ASCENDING)], unique=False)
+        client_articles_collection = self._db[MONGO_COLLECTION_CLIENT_ARTICLES]
+        cursor = news_collection.find(
+            {"clients": {"$exists": True}, "hash": {"$exists": True}},
+            {"hash": 1, "clients": 1, "created_at": 1},
+        )
+
+        def migrate_clients(docs: List[dict]) -> None:
+            # Edges are written before the arrays are removed.
+            bulk_upsert(
+                client_articles_collection,
+                [
+                    operation
+                    for doc in docs
+                    for operation in client_article_operations(
+                        doc["clients"],
+                        [doc["hash"]],
+                        doc.get("created_at") or datetime.utcnow(),
+                    )
+                ],
+            )
+            news_collection.bulk_write(
+                [
+                    UpdateOne({"_id": doc["_id"]}, {"$unset": {"clients": ""}})
+                    for doc in docs
+                ],
+                ordered=False,
+            )
+
+        moved = migrate_in_batches(cursor, migrate_clients, batch_size)
+        if moved:
+            logger.info(f"Clients of {moved} news moved to client articles.")
+
+        for index_name in ("clients_1_created_at_1", "pending_nlp"):
+            if index_name in news_collection.index_information():
+                news_collection.drop_index(index_name)
+
+        if MONGO_COLLECTION_DELIVERIES not in self._db.list_collection_names():
+            return
+
+        def migrate_deliveries(docs: List[dict]) -> None:
+            client_articles_collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"client_id": doc["client_id"], "hash": doc["hash"]},
+                        {
+                            "$set": {
+                                "digest": doc["digest"],
+                                "delivered": True,
+                                "delivered_at": doc.get("delivered_at"),
+                            },
+                            "$setOnInsert": {"created_at": doc["created_at"]},
+                        },
+                        upsert=True,
+                    )
+                    for doc in docs
+                ],
+                ordered=False,
+            )
+
+        delivered = migrate_in_batches(
+            self._db[MONGO_COLLECTION_DELIVERIES].find(),
+            migrate_deliveries,
+            batch_size,
+        )
+        self._db.drop_collection(MONGO_COLLECTION_DELIVERIES)
+        logger.info(f"{delivered} delivery records moved to client articles.")
+
+    def backfill_nlp_status(self) -> None:
+        """
+        Set `nlp_status` of news stored before it existed: "done" when
+        the sentiment is defined, "pending" otherwise.
+        """
+        news_collection = self._db[MONGO_COLLECTION_NEWS]
+        done = news_collection.update_many(
+            {"nlp_status": {"$exists": False}, "sentiment": {"$exists": True}},
+            {"$set": {"nlp_status": "done"}},
+        )
+        pending = news_collection.update_many(
+            {"nlp_status": {"$exists": False}},
+            {"$set": {"nlp_status": "pending"}},
+        )
+        if done.modified_count or pending.modified_count:
+            logger.info(
+                f"NLP status set for old news: {done.modified_count} done, "
+                f"{pending.modified_count} pending."
+            )
 
     def get_collection(self, collection_name):
+        self.connect()
         return self._db[collection_name]
 
     def load_data_from_json(self, json_file_path):
+        """
+        Add clients from the file that are not in the collection yet,
+        existing clients (matched by name) are left untouched.
+        """
         collection = self.get_collection(MONGO_COLLECTION_CLIENTS)
         with open(json_file_path, "r") as file:
             data = json.load(file)
-            if isinstance(data, list):
-                collection.insert_many(data)
-            else:
-                collection.insert_one(data)
+            if not isinstance(data, list):
+                data = [data]
+            now = datetime.utcnow()
+            result = collection.bulk_write(
+                [
+                    UpdateOne(
+                        {"client": client["client"]},
+                        {"$setOnInsert": {**client, "updated_at": now}},
+                        upsert=True,
+                    )
+                    for client in data
+                ],
+                ordered=False,
+            )
             logger.info(
-                f"Data from {json_file_path} loaded into collection {MONGO_COLLECTION_CLIENTS}"
+                f"Data from {json_file_path} loaded into collection {MONGO_COLLECTION_CLIENTS}: {result.upserted_count} new clients"
             )
 
     def close_connection(self):
-        if self._mongo_client:
+        if self._mongo_client and self._pid == os.getpid():
             self._mongo_client.close()
-            logger.info("MongoDB connection closed.")
+            logger.info(
+                f"MongoDB connection closed, pool stats: {self.pool_stats()}"
+            )
+        self._mongo_client = None
+        self._db = None
+
+
+if __name__ == "__main__":
+    with MongoDBInit() as connection:
+        connection.setup_indexes()
@@ -1,7 +1,11 @@
+import os
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator
+
 import boto3
-import httpx
 import spacy
-from httpx import Client
+import torch
 from loguru import logger
 from singleton_decorator import singleton
 from spacy import Language
@@ -11,10 +15,23 @@ from src.constants import (
     AWS_ACCESS_KEY_ID,
     AWS_REGION,
     AWS_SECRET_ACCESS_KEY,
-    NEWSCATCHER_API_KEY,
+    SENTIMENT_BACKEND,
+    SENTIMENT_MODEL_REVISION,
+    SENTIMENT_PARITY_CHECK,
+    SENTIMENT_PARITY_THRESHOLD,
+    SPACY_FAST_SEGMENTATION,
     SPACY_MODEL_CORE,
+    TORCH_INTEROP_THREADS,
+    TORCH_NUM_THREADS,
 )
 from src.db import MongoDBInit
+from src.model_store import ModelStore
+from src.sentiment_backends import (
+    SentimentBackend,
+    TorchBackend,
+    check_backend_parity,
+    create_sentiment_backend,
+)
 
 
 @singleton
@@ -26,15 +43,42 @@ class DependencyManager:
     sentimental_model: str = "ProsusAI/finbert"
 
     def __init__(self):
-        self._newscatcher_client = None
+        self.startup_metrics: Dict[str, float] = {}
 
+        self._model_path = None
         self._model = None
         self._tokenizer = None
-        self._spacy_core_nlp = None
+        self._sentiment_backend = None
+        self._spacy_sentencizer = None
 
         self._mongodb_connection = None
         self._boto3_secret_manager = None
 
+    @contextmanager
+    def startup_timer(self, name: str) -> Iterator[None]:
+        started_at = time.perf_counter()
+        yield
+        self.startup_metrics[name] = time.perf_counter() - started_at
+        logger.info(f"Startup '{name}': {self.startup_metrics[name]:.2f}s")
+
+    @staticmethod
+    def setup_torch_threads() -> None:
+        """
+        Apply intra/inter-op thread limits, 0 keeps the torch defaults.
+        """
+        if TORCH_NUM_THREADS:
+            torch.set_num_threads(TORCH_NUM_THREADS)
+        if TORCH_INTEROP_THREADS:
+            try:
+                torch.set_num_interop_threads(TORCH_INTEROP_THREADS)
+            except RuntimeError as e:
+                # Allowed only before the first inter-op parallel work.
+                logger.warning(f"Torch inter-op threads not set: {e}")
+        logger.info(
+            f"Torch uses {torch.get_num_threads()} intra-op and "
+            f"{torch.get_num_interop_threads()} inter-op threads."
+        )
+
     @property
     def boto3_secret_manager(self) -> boto3:
         if self._boto3_secret_manager is None:
@@ -50,26 +94,47 @@ class DependencyManager:
     @property
     def mongodb_connection(self) -> MongoDBInit:
         if self._mongodb_connection is None:
-            connection = MongoDBInit()
-            connection.connect()
-            self._mongodb_connection = connection
+            self._mongodb_connection = MongoDBInit()
+        # Reconnects when the process was forked since the last call.
+        self._mongodb_connection.connect()
         return self._mongodb_connection
 
+    def mongodb_pool_stats(self) -> Dict[str, int]:
+        if self._mongodb_connection is None:
+            return {}
+        return self._mongodb_connection.pool_stats()
+
+    def close(self) -> None:
+        if self._mongodb_connection is not None:
+            self._mongodb_connection.close_connection()
+            self._mongodb_connection = None
+
     @property
-    def newscatcher_client(self) -> Client:
-        if self._newscatcher_client is None:
-            self._newscatcher_client = httpx.Client(
-                headers={"x-api-token": NEWSCATCHER_API_KEY}
-            )
-            logger.info("NewsCatcher Client initialized success.")
-        return self._newscatcher_client
+    def model_path(self) -> str:
+        if self._model_path is None:
+            with self.startup_timer("model_store_seconds"):
+                self._model_path = ModelStore(
+                    self.sentimental_model, SENTIMENT_MODEL_REVISION
+                ).get()
+        return self._model_path
+
+    @property
+    def model_commit(self) -> str:
+        """
+        Commit of the model snapshot resolved by ModelStore.
+        """
+        return os.path.basename(os.path.normpath(self.model_path))
 
     @property
     def model(self) -> AutoModelForSequenceClassification:
         if self._model is None:
-            self._model = AutoModelForSequenceClassification.from_pretrained(
-                self.sentimental_model, force_download=True
-            )
+            with self.startup_timer("model_load_seconds"):
+                # Safetensors weights are memory-mapped on load.
+                self._model = (
+                    AutoModelForSequenceClassification.from_pretrained(
+                        self.model_path, local_files_only=True
+                    )
+                )
             logger.info(
                 f"Model '{self.sentimental_model}' initialized success."
             )
@@ -78,23 +143,66 @@ class DependencyManager:
     @property
     def tokenizer(self) -> AutoTokenizer:
         if self._tokenizer is None:
-            self._tokenizer = AutoTokenizer.from_pretrained(
-                self.sentimental_model, force_download=True
-            )
+            with self.startup_timer("tokenizer_load_seconds"):
+                self._tokenizer = AutoTokenizer.from_pretrained(
+                    self.model_path, local_files_only=True
+                )
             logger.info(
                 f"Tokenizer '{self.sentimental_model}' initialized success."
             )
         return self._tokenizer
 
     @property
-    def spacy_core_nlp(self) -> Language:
-        if self._spacy_core_nlp is None:
-            self._spacy_core_nlp = spacy.load(SPACY_MODEL_CORE)
+    def sentiment_backend(self) -> SentimentBackend:
+        if self._sentiment_backend is None:
+            backend = create_sentiment_backend(
+                SENTIMENT_BACKEND,
+                self.model,
+                self.tokenizer,
+                self.model_commit,
+            )
+            if SENTIMENT_PARITY_CHECK and backend.name != TorchBackend.name:
+                reference = TorchBackend(self.model)
+                agreement = check_backend_parity(
+                    backend, reference, self.tokenizer
+                )
+                if agreement < SENTIMENT_PARITY_THRESHOLD:
+                    logger.warning(
+                        f"Backend '{backend.name}' failed the parity check, "
+                        f"falling back to '{reference.name}'."
+                    )
+                    backend = reference
+            self._sentiment_backend = backend
+            logger.info(f"Sentiment backend '{backend.name}' initialized.")
+        return self._sentiment_backend
+
+    @property
+    def spacy_sentencizer(self) -> Language:
+        """
+        Pipeline used only to split text into sentences: a rule-based
+        sentencizer, or the core model with everything but sentence
+        boundary components disabled.
+        """
+        if self._spacy_sentencizer is None:
+            with self.startup_timer("spacy_load_seconds"):
+                if SPACY_FAST_SEGMENTATION:
+                    nlp = spacy.blank(SPACY_MODEL_CORE.split("_")[0])
+                    nlp.add_pipe("sentencizer")
+                else:
+                    nlp = spacy.load(SPACY_MODEL_CORE)
+                    nlp.select_pipes(
+                        enable=[
+                            name
+                            for name in nlp.pipe_names
+                            if name
+                            in ("transformer", "tok2vec", "parser", "senter")
+                        ]
+                    )
+            self._spacy_sentencizer = nlp
             logger.info(
-                f"Spacy model '{SPACY_MODEL_CORE}' initialized success."
+                f"Spacy sentencizer {nlp.pipe_names} initialized success."
             )
-        return self._spacy_core_nlp
+        return self._spacy_sentencizer
 
     def __del__(self):
-        if self._mongodb_connection:
-            self._mongodb_connection.close()
+        self.close()
@@ -0,0 +1,147 @@
+import os
+import socket
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Dict, Iterator, Optional
+
+from loguru import logger
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    multiprocess,
+    start_http_server,
+)
+
+from src.constants import (
+    METRICS_ENABLED,
+    METRICS_PORT,
+    MONGO_COLLECTION_METRICS,
+)
+from src.dependencies import DependencyManager
+
+WORKER_TYPE = os.getenv("WORKER", "beat")
+
+STAGE_SECONDS = Histogram(
+    "pipeline_stage_seconds",
+    "Duration of a pipeline stage.",
+    ["stage", "client_id"],
+    buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 900),
+)
+QUEUE_WAIT_SECONDS = Histogram(
+    "pipeline_queue_wait_seconds",
+    "Time between publishing a task and a worker starting it.",
+    ["task"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900),
+)
+ARTICLES = Counter(
+    "pipeline_articles_total",
+    "Articles handled by a stage.",
+    ["stage", "client_id"],
+)
+SENTENCES = Counter(
+    "pipeline_sentences_total",
+    "Code word sentences sent to sentiment inference.",
+    ["client_id"],
+)
+CACHE_LOOKUPS = Counter(
+    "pipeline_cache_lookups_total",
+    "Cache lookups by cache and result (memory_hit, db_hit, hit, miss).",
+    ["cache", "result"],
+)
+BYTES_SENT = Counter(
+    "pipeline_bytes_sent_total",
+    "Payload bytes delivered to clients.",
+    ["client_id", "sending_mode"],
+)
+MONGO_POOL_CONNECTIONS = Gauge(
+    "mongo_pool_connections",
+    "Open and checked out connections of the MongoDB pool.",
+    ["state"],
+    multiprocess_mode="livesum",
+)
+STARTUP_SECONDS = Gauge(
+    "worker_startup_seconds",
+    "Duration of worker startup steps.",
+    ["step"],
+    multiprocess_mode="max",
+)
+
+
+@contextmanager
+def stage_timer(
+    stage: str, client_id: Optional[str] = None
+) -> Iterator[Dict[str, int]]:
+    """
+    Time a pipeline stage. Counts put into the yielded dict are stored
+    with the duration in the metrics collection of MongoDB.
+    """
+    counts: Dict[str, int] = {}
+    started_at = time.perf_counter()
+    try:
+        yield counts
+    finally:
+        duration = time.perf_counter() - started_at
+        STAGE_SECONDS.labels(stage, client_id or "").observe(duration)
+        write_record(
+            {
+                "stage": stage,
+                "client_id": client_id,
+                "duration": duration,
+                "counts": counts,
+            }
+        )
+
+
+def write_record(record: Dict) -> None:
+    if not METRICS_ENABLED:
+        return
+    try:
+        DependencyManager().mongodb_connection.get_collection(
+            MONGO_COLLECTION_METRICS
+        ).insert_one(
+            {
+                **record,
+                "worker": WORKER_TYPE,
+                "host": socket.gethostname(),
+                "created_at": datetime.utcnow(),
+            }
+        )
+    except Exception as e:
+        logger.warning(f"Metrics record not written: {e}")
+
+
+def record_pool_stats() -> None:
+    stats = DependencyManager().mongodb_pool_stats()
+    if stats:
+        MONGO_POOL_CONNECTIONS.labels("open").set(stats["open"])
+        MONGO_POOL_CONNECTIONS.labels("in_use").set(stats["in_use"])
+
+
+def set_startup_metrics(startup_metrics: Dict[str, float]) -> None:
+    for step, seconds in startup_metrics.items():
+        STARTUP_SECONDS.labels(step).set(seconds)
+    write_record({"stage": "startup", "startup": startup_metrics})
+
+
+def start_metrics_server() -> None:
+    """
+    Expose metrics of this worker on METRICS_PORT. With prefork workers
+    set PROMETHEUS_MULTIPROC_DIR so that children metrics are aggregated.
+    """
+    if not METRICS_ENABLED:
+        return
+    registry = REGISTRY
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    start_http_server(METRICS_PORT, registry=registry)
+    logger.info(f"Metrics of '{WORKER_TYPE}' worker on port {METRICS_PORT}.")
+
+
+def mark_process_dead(pid: int) -> None:
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(pid)
@@ -0,0 +1,133 @@
+import hashlib
+import json
+import os
+from typing import Dict
+
+from huggingface_hub import snapshot_download
+from huggingface_hub.utils import LocalEntryNotFoundError
+from loguru import logger
+
+from src.constants import MODEL_CACHE_DIR, MODEL_VERIFY_INTEGRITY
+
+
+class ModelStore:
+    """
+    Offline-first store of Hugging Face model snapshots. The first boot
+    downloads `revision` into MODEL_CACHE_DIR and records the resolved
+    commit with sha256 of every file in a manifest; later boots load that
+    exact snapshot without network access and verify it against the
+    manifest.
+    """
+
+    allow_patterns = ["*.json", "*.txt", "*.safetensors"]
+    fallback_weights = "pytorch_model.bin"
+
+    def __init__(
+        self,
+        repo_id: str,
+        revision: str,
+        cache_dir: str = os.path.join(MODEL_CACHE_DIR, "hf"),
+    ):
+        self.repo_id = repo_id
+        self.revision = revision
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(
+            cache_dir,
+            f"{repo_id.replace('/', '--')}@{revision}.manifest.json",
+        )
+
+    def get(self) -> str:
+        """
+        Return a local directory with a verified model snapshot.
+        """
+        manifest = self._read_manifest()
+        if manifest:
+            try:
+                path = snapshot_download(
+                    self.repo_id,
+                    revision=manifest["commit"],
+                    cache_dir=self.cache_dir,
+                    allow_patterns=list(manifest["files"]),
+                    local_files_only=True,
+                )
+                if self._verify(path, manifest["files"]):
+                    logger.info(
+                        f"Model '{self.repo_id}' loaded from local store "
+                        f"at commit {manifest['commit']}."
+                    )
+                    return path
+                logger.warning(
+                    f"Local snapshot of '{self.repo_id}' failed the "
+                    "integrity check, downloading it again."
+                )
+            except LocalEntryNotFoundError:
+                logger.warning(
+                    f"Local snapshot of '{self.repo_id}' not found, "
+                    "downloading it."
+                )
+        return self._download(force=bool(manifest))
+
+    def _download(self, force: bool) -> str:
+        path = snapshot_download(
+            self.repo_id,
+            revision=self.revision,
+            cache_dir=self.cache_dir,
+            allow_patterns=self.allow_patterns,
+            force_download=force,
+        )
+        if not self._has_safetensors(path):
+            path = snapshot_download(
+                self.repo_id,
+                revision=self.revision,
+                cache_dir=self.cache_dir,
+                allow_patterns=self.allow_patterns + [self.fallback_weights],
+                force_download=force,
+            )
+
+        files = {
+            name: self._sha256(os.path.join(path, name))
+            for name in sorted(os.listdir(path))
+            if os.path.isfile(os.path.join(path, name))
+        }
+        self._write_manifest(
+            {"commit": os.path.basename(path), "files": files}
+        )
+        logger.info(
+            f"Model '{self.repo_id}' downloaded at commit "
+            f"{os.path.basename(path)}."
+        )
+        return path
+
+    @staticmethod
+    def _has_safetensors(path: str) -> bool:
+        return any(name.endswith(".safetensors") for name in os.listdir(path))
+
+    def _verify(self, path: str, files: Dict[str, str]) -> bool:
+        for name, digest in files.items():
+            file_path = os.path.join(path, name)
+            if not os.path.exists(file_path):
+                return False
+            if MODEL_VERIFY_INTEGRITY and self._sha256(file_path) != digest:
+                return False
+        return True
+
+    @staticmethod
+    def _sha256(file_path: str) -> str:
+        digest = hashlib.sha256()
+        with open(file_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    def _read_manifest(self) -> Dict:
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path, "r") as file:
+            return json.load(file)
+
+    def _write_manifest(self, manifest: Dict) -> None:
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(manifest, file, indent=2)
+        os.replace(tmp_path, self.manifest_path)
@@ -0,0 +1,281 @@
+import io
+import time
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import orjson
+from bson import ObjectId
+from loguru import logger
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    raise TypeError(f"Type is not JSON serializable: {type(value).__name__}")
+
+
+def dumps(data, sort_keys: bool = False) -> bytes:
+    """
+    orjson encoding that also accepts ObjectId values from MongoDB
+    (datetime is supported by orjson itself).
+    """
+    return orjson.dumps(
+        data,
+        default=_default,
+        option=orjson.OPT_SORT_KEYS if sort_keys else None,
+    )
+
+
+class OutputFormat:
+    """
+    Encoding of delivered news configured per client by its `output`
+    field, e.g. {"format": "ndjson", "compression": "zstd"}. Compressed
+    json/ndjson payloads carry a content encoding, Parquet compresses its
+    columns itself.
+    """
+
+    formats: Dict[str, Tuple[str, str]] = {
+        "json": ("application/json", "json"),
+        "ndjson": ("application/x-ndjson", "ndjson"),
+        "parquet": ("application/vnd.apache.parquet", "parquet"),
+    }
+    compressions: Dict[str, str] = {"none": "", "gzip": "gz", "zstd": "zst"}
+
+    def __init__(self, format: str = "json", compression: str = "none"):
+        if format not in self.formats:
+            raise ValueError(f"Unknown output format: {format}")
+        if compression not in self.compressions:
+            raise ValueError(f"Unknown output compression: {compression}")
+        self.format = format
+        self.compression = compression
+
+    @classmethod
+    def from_config(
+        cls,
+        output: Optional[Dict],
+        default_format: str = "json",
+        allowed_formats: Iterable[str] = ("json", "ndjson"),
+    ) -> "OutputFormat":
+        output = output or {}
+        output_format = output.get("format", default_format)
+        if output_format not in allowed_formats:
+            logger.warning(
+                f"Output format '{output_format}' is not supported here, "
+                f"'{default_format}' is used."
+            )
+            output_format = default_format
+        return cls(output_format, output.get("compression", "none"))
+
+    def __repr__(self) -> str:
+        return f"OutputFormat({self.format!r}, {self.compression!r})"
+
+    @property
+    def content_type(self) -> str:
+        return self.formats[self.format][0]
+
+    @property
+    def content_encoding(self) -> Optional[str]:
+        if self.format == "parquet" or self.compression == "none":
+            return None
+        return self.compression
+
+    @property
+    def extension(self) -> str:
+        extension = self.formats[self.format][1]
+        if self.content_encoding:
+            extension = f"{extension}.{self.compressions[self.compression]}"
+        return extension
+
+    @property
+    def message_format(self) -> "OutputFormat":
+        # Plain messages (not a list of news) are JSON in every format.
+        if self.format == "parquet":
+            return OutputFormat("json")
+        return OutputFormat("json", self.compression)
+
+    def encode(self, docs: List[Dict]) -> bytes:
+        """
+        Encode and compress a whole payload.
+        """
+        return b"".join(self.stream([docs]))
+
+    def encode_message(self, data) -> bytes:
+        return self.message_format.compress(dumps(data))
+
+    def stream(self, batches: Iterable[List[Dict]]) -> Iterator[bytes]:
+        """
+        Encode streamed documents into one compressed payload piece by
+        piece. Parquet needs all documents at once and is built in memory.
+        """
+        if self.format == "parquet":
+            yield self.encode_parquet(
+                [doc for batch in batches for doc in batch]
+            )
+            return
+
+        compressor = self.compressor()
+        is_array = self.format == "json"
+        if is_array:
+            yield compressor.compress(b"[")
+        first = True
+        for batch in batches:
+            data = bytearray()
+            for doc in batch:
+                if is_array and not first:
+                    data += b","
+                data += dumps(doc)
+                if not is_array:
+                    data += b"\n"
+                first = False
+            yield compressor.compress(bytes(data))
+        if is_array:
+            yield compressor.compress(b"]")
+        yield compressor.flush()
+
+    def compress(self, data: bytes) -> bytes:
+        compressor = self.compressor()
+        return compressor.compress(data) + compressor.flush()
+
+    def compressor(self):
+        if self.content_encoding == "gzip":
+            return zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        if self.content_encoding == "zstd":
+            import zstandard
+
+            return zstandard.ZstdCompressor(level=3).compressobj()
+        return _NoCompressor()
+
+    def pack(
+        self,
+        batches: Iterable[List[Dict]],
+        max_size: int,
+        skipped: Optional[List[Dict]] = None,
+    ) -> Iterator[Tuple[bytes, List[Dict]]]:
+        """
+        Re-pack streamed documents into uncompressed json arrays or ndjson
+        chunks of at most `max_size` bytes each, yielded with the documents
+        they hold. A document that does not fit on its own is skipped and
+        appended to `skipped`.
+        """
+        if self.format == "ndjson":
+            opening, separator, closing = b"", b"", b""
+        else:
+            opening, separator, closing = b"[", b",", b"]"
+        overhead = len(opening) + len(closing)
+
+        chunk, chunk_size, docs = [], overhead, []
+        for batch in batches:
+            for doc in batch:
+                encoded = dumps(doc)
+                if self.format == "ndjson":
+                    encoded += b"\n"
+                if len(encoded) + overhead > max_size:
+                    logger.error(
+                        f"Document of {len(encoded)} bytes exceeds the "
+                        f"{max_size} bytes message limit and is skipped."
+                    )
+                    if skipped is not None:
+                        skipped.append(doc)
+                    continue
+                if chunk and chunk_size + len(encoded) + len(separator) > (
+                    max_size
+                ):
+                    yield opening + separator.join(chunk) + closing, docs
+                    chunk, chunk_size, docs = [], overhead, []
+                chunk.append(encoded)
+                chunk_size += len(encoded) + len(separator)
+                docs.append(doc)
+        if chunk:
+            yield opening + separator.join(chunk) + closing, docs
+
+    def encode_parquet(self, docs: List[Dict]) -> bytes:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        # The round trip turns ObjectId/datetime into plain values. The
+        # schema is inferred from every document, not only the first one:
+        # news without code word sentences have no `sentiment`.
+        rows = orjson.loads(dumps(docs))
+        schema = pa.schema(list(pa.array(rows).type)) if rows else None
+        table = pa.Table.from_pylist(rows, schema=schema)
+        buffer = io.BytesIO()
+        pq.write_table(
+            table,
+            buffer,
+            compression=(
+                "snappy" if self.compression == "none" else self.compression
+            ),
+        )
+        return buffer.getvalue()
+
+
+class _NoCompressor:
+    @staticmethod
+    def compress(data: bytes) -> bytes:
+        return data
+
+    @staticmethod
+    def flush() -> bytes:
+        return b""
+
+
+def benchmark(
+    docs: List[Dict], output_formats: Iterable[OutputFormat]
+) -> List[Dict]:
+    """
+    Encode time and output size of `docs` in every format.
+    """
+    results = []
+    for output_format in output_formats:
+        started_at = time.perf_counter()
+        try:
+            size = len(output_format.encode(docs))
+        except ImportError as e:
+            logger.warning(f"{output_format} skipped: {e}")
+            continue
+        results.append(
+            {
+                "format": output_format.format,
+                "compression": output_format.compression,
+                "seconds": time.perf_counter() - started_at,
+                "bytes": size,
+            }
+        )
+    return results
+
+
+if __name__ == "__main__":
+    import json
+    import random
+    from datetime import datetime
+
+    words = "market shares bank rates growth profit loss report".split()
+    sample_docs = [
+        {
+            "title": " ".join(random.choices(words, k=8)),
+            "link": f"https://example.com/news/{idx}",
+            "published_date": datetime.utcnow(),
+            "content": " ".join(random.choices(words, k=600)),
+            "sentiment": [[" ".join(random.choices(words, k=12)), "positive"]],
+        }
+        for idx in range(2000)
+    ]
+
+    started_at = time.perf_counter()
+    stdlib_size = len(json.dumps(sample_docs, default=str).encode("utf-8"))
+    logger.info(
+        f"stdlib json: {time.perf_counter() - started_at:.3f}s, "
+        f"{stdlib_size} bytes"
+    )
+    for result in benchmark(
+        sample_docs,
+        [
+            OutputFormat(output_format, compression)
+            for output_format in OutputFormat.formats
+            for compression in OutputFormat.compressions
+        ],
+    ):
+        logger.info(
+            f"{result['format']}/{result['compression']}: "
+            f"{result['seconds']:.3f}s, {result['bytes']} bytes"
+        )
@@ -0,0 +1,88 @@
+from datetime import datetime, timezone
+from functools import lru_cache
+from typing import Optional
+
+from celery.schedules import crontab
+from loguru import logger
+
+from src.celery_conf import celery_app
+
+
+def parse_cron_string(cron_str: str) -> dict:
+    try:
+        minute, hour, day_of_month, month, day_of_week = cron_str.split()
+        return {
+            "minute": minute,
+            "hour": hour,
+            "day_of_month": day_of_month,
+            "month_of_year": month,
+            "day_of_week": day_of_week,
+        }
+    except Exception as e:
+        logger.error(f"Error parsing cron string {cron_str}: {e}")
+        raise
+
+
+@lru_cache(maxsize=4096)
+def get_crontab(cron_str: str) -> crontab:
+    # Clients share a few distinct cron strings, parse each one once.
+    return crontab(**parse_cron_string(cron_str), app=celery_app)
+
+
+def next_run_at(cron_str: str, after: datetime) -> datetime:
+    """
+    Next fire time of `cron_str` strictly after `after`, evaluated in the
+    celery app timezone and returned in UTC.
+    """
+    schedule = get_crontab(cron_str)
+    after = after.astimezone(celery_app.timezone)
+    start, delta, _ = schedule.remaining_delta(after)
+    return (start + delta).astimezone(timezone.utc)
+
+
+def client_next_run_at(client: dict, after: datetime) -> Optional[datetime]:
+    """
+    Next fire time of a client, None when its cron is invalid: such a
+    client stays unscheduled until its cron is changed.
+    """
+    try:
+        return next_run_at(client["cron"], after=after)
+    except Exception as e:
+        logger.error(
+            f"Client '{client['_id']}' unscheduled, invalid cron "
+            f"{client.get('cron')!r}: {e}"
+        )
+        return None
+
+
+def sync_clients_schedule(services, now: datetime) -> int:
+    """
+    Apply schedule deltas: (re)schedule clients that are new or whose
+    `cron` changed since the last sync. Deleted clients simply stop being
+    due. Returns the number of rescheduled clients.
+    """
+    clients = services.get_changed_clients(
+        since=services.get_schedule_watermark()
+    )
+
+    schedules = {}
+    for client in clients:
+        if (
+            "next_run_at" in client
+            and client.get("scheduled_cron") == client["cron"]
+        ):
+            continue
+        schedules[client["_id"]] = (
+            client_next_run_at(client, after=now),
+            client.get("cron"),
+        )
+    services.set_clients_schedule(schedules)
+
+    updated_at = [
+        client["updated_at"] for client in clients if "updated_at" in client
+    ]
+    if updated_at:
+        services.set_schedule_watermark(max(updated_at))
+    if schedules:
+        logger.info(f"Schedule of {len(schedules)} clients updated.")
+    return len(schedules)
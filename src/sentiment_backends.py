@@ -0,0 +1,257 @@
+import os
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional
+
+import torch
+from loguru import logger
+from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+from src.constants import (
+    MODEL_CACHE_DIR,
+    SENTIMENT_PARITY_THRESHOLD,
+    TORCH_NUM_THREADS,
+)
+
+PARITY_SAMPLE_TEXTS: List[str] = [
+    "Shares of the company rose 12% after quarterly earnings beat estimates.",
+    "The bank reported a net loss and cut its full-year guidance.",
+    "The board will meet on Tuesday to discuss the annual report.",
+    "Analysts downgraded the stock citing weak demand in Europe.",
+    "Revenue grew steadily while operating costs remained flat.",
+    "The merger is expected to close in the second half of the year.",
+    "Investors fear that rising rates will hurt consumer spending.",
+    "The company announced a record dividend for shareholders.",
+]
+
+
+class SentimentBackend(ABC):
+    """
+    Runs the FinBERT classifier head on tokenized inputs. `name` is part
+    of the sentiment cache key, so labels of different backends never mix.
+    """
+
+    name: str
+
+    def __init__(self, model: AutoModelForSequenceClassification):
+        self.id2label: Dict[int, str] = model.config.id2label
+
+    @abstractmethod
+    def logits(self, inputs: Dict[str, torch.Tensor]) -> torch.Tensor:
+        pass
+
+    def predict(self, tokenizer: AutoTokenizer, texts: List[str]) -> List[str]:
+        inputs = tokenizer(
+            texts, padding=True, truncation=True, return_tensors="pt"
+        )
+        labels = self.logits(inputs).argmax(dim=-1).tolist()
+        return [self.id2label[label] for label in labels]
+
+
+class TorchBackend(SentimentBackend):
+    name = "pytorch"
+
+    def __init__(self, model: AutoModelForSequenceClassification):
+        super().__init__(model)
+        self.model = model.eval()
+
+    def logits(self, inputs: Dict[str, torch.Tensor]) -> torch.Tensor:
+        with torch.no_grad():
+            return self.model(**inputs).logits
+
+
+class QuantizedTorchBackend(TorchBackend):
+    """
+    Dynamic int8 quantization of the Linear layers, cached on disk per
+    model commit.
+    """
+
+    name = "pytorch_int8"
+
+    def __init__(self, model: AutoModelForSequenceClassification, commit: str):
+        path = cache_path(commit, f"{self.name}.pt")
+        if os.path.exists(path):
+            quantized = torch.load(path, weights_only=False)
+            logger.info(f"Quantized model loaded from '{path}'.")
+        else:
+            quantized = torch.ao.quantization.quantize_dynamic(
+                model.eval(), {torch.nn.Linear}, dtype=torch.qint8
+            )
+            atomic_save(path, lambda tmp_path: torch.save(quantized, tmp_path))
+            logger.info(f"Quantized model saved to '{path}'.")
+        super().__init__(quantized)
+
+
+class OnnxBackend(SentimentBackend):
+    """
+    ONNX Runtime session over the exported model, optionally with int8
+    dynamic quantization. The exported files are cached on disk per model
+    commit.
+    """
+
+    name = "onnx"
+    quantize: bool = False
+
+    def __init__(
+        self,
+        model: AutoModelForSequenceClassification,
+        tokenizer: AutoTokenizer,
+        commit: str,
+    ):
+        import onnxruntime
+
+        super().__init__(model)
+        path = self.export(model, tokenizer, commit)
+
+        options = onnxruntime.SessionOptions()
+        if TORCH_NUM_THREADS:
+            options.intra_op_num_threads = TORCH_NUM_THREADS
+        self.session = onnxruntime.InferenceSession(
+            path, options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [item.name for item in self.session.get_inputs()]
+
+    def export(
+        self,
+        model: AutoModelForSequenceClassification,
+        tokenizer: AutoTokenizer,
+        commit: str,
+    ) -> str:
+        path = cache_path(commit, "onnx.onnx")
+        if not os.path.exists(path):
+            sample = tokenizer(
+                PARITY_SAMPLE_TEXTS[:2], padding=True, return_tensors="pt"
+            )
+            input_names = list(sample.keys())
+            atomic_save(
+                path,
+                lambda tmp_path: torch.onnx.export(
+                    model.eval(),
+                    tuple(sample[name] for name in input_names),
+                    tmp_path,
+                    input_names=input_names,
+                    output_names=["logits"],
+                    dynamic_axes={
+                        **{
+                            name: {0: "batch", 1: "sequence"}
+                            for name in input_names
+                        },
+                        "logits": {0: "batch"},
+                    },
+                    opset_version=14,
+                ),
+            )
+            logger.info(f"Model exported to ONNX at '{path}'.")
+
+        if not self.quantize:
+            return path
+
+        quantized_path = cache_path(commit, f"{self.name}.onnx")
+        if not os.path.exists(quantized_path):
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+
+            atomic_save(
+                quantized_path,
+                lambda tmp_path: quantize_dynamic(
+                    path, tmp_path, weight_type=QuantType.QInt8
+                ),
+            )
+            logger.info(f"Quantized ONNX model saved to '{quantized_path}'.")
+        return quantized_path
+
+    def logits(self, inputs: Dict[str, torch.Tensor]) -> torch.Tensor:
+        outputs = self.session.run(
+            ["logits"],
+            {name: inputs[name].numpy() for name in self.input_names},
+        )
+        return torch.from_numpy(outputs[0])
+
+
+class QuantizedOnnxBackend(OnnxBackend):
+    name = "onnx_int8"
+    quantize = True
+
+
+def create_sentiment_backend(
+    name: str,
+    model: AutoModelForSequenceClassification,
+    tokenizer: AutoTokenizer,
+    commit: str,
+) -> SentimentBackend:
+    """
+    `commit` is the resolved model commit the exported files are cached
+    under.
+    """
+    if name == TorchBackend.name:
+        return TorchBackend(model)
+    if name == QuantizedTorchBackend.name:
+        return QuantizedTorchBackend(model, commit)
+    if name == OnnxBackend.name:
+        return OnnxBackend(model, tokenizer, commit)
+    if name == QuantizedOnnxBackend.name:
+        return QuantizedOnnxBackend(model, tokenizer, commit)
+    raise ValueError(f"Unknown sentiment backend: {name}")
+
+
+def check_backend_parity(
+    backend: SentimentBackend,
+    reference: SentimentBackend,
+    tokenizer: AutoTokenizer,
+    texts: Optional[List[str]] = None,
+) -> float:
+    """
+    Share of texts labelled the same by `backend` and the fp32 `reference`.
+    """
+    texts = texts or PARITY_SAMPLE_TEXTS
+    labels = backend.predict(tokenizer, texts)
+    reference_labels = reference.predict(tokenizer, texts)
+    agreement = sum(
+        label == reference_label
+        for label, reference_label in zip(labels, reference_labels)
+    ) / len(texts)
+
+    if agreement < SENTIMENT_PARITY_THRESHOLD:
+        logger.warning(
+            f"Backend '{backend.name}' agrees with fp32 on {agreement:.0%} "
+            f"of labels, below {SENTIMENT_PARITY_THRESHOLD:.0%}."
+        )
+    else:
+        logger.info(
+            f"Backend '{backend.name}' agrees with fp32 on {agreement:.0%} "
+            f"of labels."
+        )
+    return agreement
+
+
+def cache_path(commit: str, file_name: str) -> str:
+    directory = os.path.join(MODEL_CACHE_DIR, "finbert", commit)
+    os.makedirs(directory, exist_ok=True)
+    return os.path.join(directory, file_name)
+
+
+def atomic_save(path: str, save) -> None:
+    # Concurrent workers never read a half-written file.
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    save(tmp_path)
+    os.replace(tmp_path, path)
+
+
+if __name__ == "__main__":
+    from src.dependencies import DependencyManager
+
+    manager = DependencyManager()
+    reference_backend = TorchBackend(manager.model)
+    for backend_class in (
+        QuantizedTorchBackend,
+        OnnxBackend,
+        QuantizedOnnxBackend,
+    ):
+        check_backend_parity(
+            create_sentiment_backend(
+                backend_class.name,
+                manager.model,
+                manager.tokenizer,
+                manager.model_commit,
+            ),
+            reference_backend,
+            manager.tokenizer,
+        )
@@ -1,17 +1,53 @@
+import itertools
 import os
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
-from celery import chain, signals
+from celery import chain, group, signals
 from celery.signals import task_failure
+from celery.utils.time import get_exponential_backoff_interval
 from loguru import logger
 
 # from celery.signals import task_success
 from src.celery_conf import celery_app
+from src.constants import (
+    DISPATCH_MAX_CLIENTS,
+    DISPATCH_MISFIRE_GRACE,
+    PIPELINE_BATCH_MODE,
+    PIPELINE_BATCH_SIZE,
+    PIPELINE_LOG_FILE,
+)
 from src.dependencies import DependencyManager
-from src.tasks_handlers import NlpProcesData, SendingStrategyFactory
-from src.utils import HttpHook, MongoDBServices
+from src.metrics import (
+    ARTICLES,
+    QUEUE_WAIT_SECONDS,
+    STAGE_SECONDS,
+    mark_process_dead,
+    record_pool_stats,
+    set_startup_metrics,
+    stage_timer,
+    start_metrics_server,
+    write_record,
+)
+from src.scheduling import client_next_run_at, sync_clients_schedule
+from src.tasks_handlers import (
+    NlpProcesData,
+    SendingStrategy,
+    SendingStrategyFactory,
+)
+from src.utils import (
+    DeliveryTracker,
+    HttpHook,
+    MongoDBServices,
+    NewsCatcherFetchCache,
+    first_of_clusters,
+    normalize_newscatcher_params,
+)
 
 logger.add(
-    "logging/pipeline.log",
+    PIPELINE_LOG_FILE,
     rotation="500 MB",
     retention="10 days",
     compression="zip",
@@ -20,32 +56,333 @@ logger.add(
     serialize=False,
 )
 
+_task_started_at: Dict[str, float] = {}
+
+
+@signals.worker_init.connect
+def preload_models(signal, sender, **kwargs):
+    # Loaded once in the main process: prefork children share the weights
+    # copy-on-write and a threads pool uses them directly.
+    if os.getenv("WORKER") == "cpu":
+        manager = DependencyManager()
+        manager.setup_torch_threads()
+        _ = manager.spacy_sentencizer
+        _ = manager.sentiment_backend
+        logger.info(f"cpu-worker startup metrics: {manager.startup_metrics}")
+        set_startup_metrics(manager.startup_metrics)
+    start_metrics_server()
+
 
 @signals.worker_process_init.connect
 def setup_model(signal, sender, **kwargs):
     manager = DependencyManager()
+    # Each child opens its own pool instead of the one inherited by fork.
     _ = manager.mongodb_connection
 
-    if os.getenv("WORKER") == "io":
-        _ = manager.newscatcher_client
-
     if os.getenv("WORKER") == "cpu":
-        _ = manager.spacy_core_nlp
-        _ = manager.model
-        _ = manager.tokenizer
+        manager.setup_torch_threads()
 
     if os.getenv("WORKER") == "sending":
         _ = manager.boto3_secret_manager
 
 
+@signals.worker_process_shutdown.connect
+def shutdown_process(signal, sender, pid=None, **kwargs):
+    DependencyManager().close()
+    mark_process_dead(pid or os.getpid())
+
+
+@signals.worker_shutdown.connect
+def shutdown_worker(signal, sender, **kwargs):
+    DependencyManager().close()
+
+
+@signals.before_task_publish.connect
+def add_published_at(headers=None, **kwargs):
+    # Read back by the worker to measure the time spent in the queue.
+    if headers is not None:
+        headers["published_at"] = time.time()
+
+
+@signals.task_prerun.connect
+def start_task_timer(task_id=None, task=None, **kwargs):
+    _task_started_at[task_id] = time.perf_counter()
+    published_at = getattr(task.request, "published_at", None)
+    if published_at:
+        QUEUE_WAIT_SECONDS.labels(task.name).observe(
+            max(0.0, time.time() - published_at)
+        )
+
+
+@signals.task_postrun.connect
+def stop_task_timer(
+    task_id=None, task=None, args=None, kwargs=None, state=None, **_
+):
+    started_at = _task_started_at.pop(task_id, None)
+    if started_at is None:
+        return
+    duration = time.perf_counter() - started_at
+    client_ids = task_client_ids(args or (), kwargs or {})
+    for client_id in client_ids or [""]:
+        STAGE_SECONDS.labels(task.name, client_id).observe(duration)
+    record_pool_stats()
+    write_record(
+        {
+            "stage": task.name,
+            "client_ids": client_ids,
+            "duration": duration,
+            "state": state,
+        }
+    )
+
+
+def task_client_ids(args: tuple, kwargs: dict) -> List[str]:
+    # Batch tasks get the clients payload as a keyword or from the chain.
+    clients = kwargs.get("clients") or (args[0] if args else None)
+    if isinstance(clients, list):
+        return [client["client_id"] for client in clients]
+    if kwargs.get("client_ids"):
+        return list(kwargs["client_ids"])
+    if kwargs.get("client_id"):
+        return [kwargs["client_id"]]
+    return []
+
+
+def count_articles(
+    batches: Iterable[List[dict]], counts: Dict[str, int]
+) -> Iterator[List[dict]]:
+    for batch in batches:
+        counts["articles"] = counts.get("articles", 0) + len(batch)
+        yield batch
+
+
+def build_task_chain(client_ids: List[str]) -> chain:
+    """
+    One NewsCatcher fetch for clients with identical params, then the NLP
+    and sending stages of every client.
+    """
+    return chain(
+        task_newscatcher_hook.si(client_ids=client_ids),
+        group(
+            task_ml_process_news_data.si(client_id=client_id)
+            | task_send_data.si(client_id=client_id)
+            for client_id in client_ids
+        ),
+    )
+
+
+def build_batch_chain(clients: List[dict]) -> chain:
+    """
+    Fetch, NLP and sending stages of a batch of clients, one task each.
+    `clients` are client configs, every stage passes them on with the
+    article hashes of each client.
+    """
+    return chain(
+        task_newscatcher_batch.s(clients=clients),
+        task_ml_process_news_batch.s(),
+        task_send_data_batch.s(),
+    )
+
+
+def client_config(client: dict) -> dict:
+    return {
+        "client_id": str(client["_id"]),
+        "newscatcher_params": client["newscatcher_params"],
+        "code_word": client["newscatcher_params"]["q"],
+        "nlp": client["nlp"],
+        "send_to": client["send_to"],
+        "output": client.get("output"),
+        "dedup": client.get("dedup", False),
+    }
+
+
 @celery_app.task(name="clients_pipeline.tasks.run_task_chain")
 def run_task_chain(**kwargs) -> None:
-    task_chain = chain(
-        task_newscatcher_hook.si(client_id=kwargs["client_id"])
-        | task_ml_process_news_data.si(client_id=kwargs["client_id"])
-        | task_send_data.si(client_id=kwargs["client_id"])
+    client_ids = kwargs.get("client_ids") or [kwargs["client_id"]]
+    build_task_chain(client_ids).apply_async()
+
+
+@celery_app.task(name="dispatch_due_clients")
+def task_dispatch_due_clients() -> None:
+    now = datetime.now(timezone.utc)
+    services = MongoDBServices()
+    sync_clients_schedule(services, now=now)
+
+    # Runs that fell due after the last tick and longer than the grace ago
+    # were missed while the dispatcher was down: they are skipped, not
+    # fired at once. Runs due at an earlier tick are late, not missed.
+    last_tick = services.get_last_dispatch()
+    misfire_before = now - timedelta(seconds=DISPATCH_MISFIRE_GRACE)
+
+    groups = defaultdict(list)
+    while True:
+        # Due clients are read in pages until none is left, so a backlog
+        # larger than a page is delayed, never dropped.
+        due_clients = services.get_due_clients(
+            now=now, limit=DISPATCH_MAX_CLIENTS
+        )
+        if not due_clients:
+            break
+        next_runs = {}
+        for client in due_clients:
+            next_runs[client["_id"]] = (
+                client_next_run_at(client, after=now),
+                client.get("cron"),
+            )
+            if next_runs[client["_id"]][0] is None:
+                continue
+            run_at = client["next_run_at"].replace(tzinfo=timezone.utc)
+            if run_at < misfire_before and (
+                last_tick is None or run_at > last_tick
+            ):
+                logger.warning(
+                    f"Missed run of client_id '{client['_id']}' at "
+                    f"{client['next_run_at']} skipped."
+                )
+                continue
+            params_key = normalize_newscatcher_params(
+                client["newscatcher_params"]
+            )
+            groups[params_key].append(client)
+        # Reschedule before enqueueing, a crashed tick skips a run instead
+        # of firing it twice.
+        services.set_clients_schedule(next_runs)
+    services.set_last_dispatch(now)
+    if not groups:
+        return
+
+    if PIPELINE_BATCH_MODE:
+        # Clients with the same params stay next to each other, so most
+        # of them share a fetch inside their batch.
+        clients = [
+            client_config(client)
+            for group_clients in groups.values()
+            for client in group_clients
+        ]
+        chains = [
+            build_batch_chain(clients[start : start + PIPELINE_BATCH_SIZE])
+            for start in range(0, len(clients), PIPELINE_BATCH_SIZE)
+        ]
+    else:
+        chains = [
+            build_task_chain([str(client["_id"]) for client in group_clients])
+            for group_clients in groups.values()
+        ]
+    for task_chain in chains:
+        task_chain.apply_async()
+    logger.info(
+        f"Dispatched {sum(map(len, groups.values()))} due clients "
+        f"in {len(chains)} chains."
     )
-    task_chain.apply_async()
+
+
+def fetch_news(client_ids: List[str], newscatcher_params: dict) -> None:
+    """
+    One NewsCatcher fetch for clients with the same params, shared with
+    other tasks through the fetch cache, and the dedup of its articles.
+    """
+    fetch_cache = NewsCatcherFetchCache()
+    cache_key = fetch_cache.key(newscatcher_params)
+    cached_hashes = fetch_cache.get_or_claim(cache_key)
+    if cached_hashes is not None:
+        MongoDBServices().add_clients_to_news(
+            client_ids=client_ids, hashes=cached_hashes
+        )
+        return
+
+    try:
+        hashes = fetch_and_dedup(client_ids, newscatcher_params)
+        fetch_cache.store(cache_key, hashes)
+    except Exception:
+        # Tasks waiting for the claim fetch by themselves at once.
+        fetch_cache.release(cache_key)
+        raise
+
+
+def fetch_and_dedup(
+    client_ids: List[str], newscatcher_params: dict
+) -> List[str]:
+    """
+    Fetch news from NewsCatcher, store new ones and link all of them to
+    the clients. Returns hashes of the fetched news.
+    """
+    with stage_timer("fetch", client_ids[0]) as counts:
+        newscatcher_data = HttpHook().newscatcher_hook(
+            params=newscatcher_params
+        )
+        counts["articles"] = len(newscatcher_data["articles"])
+    for client_id in client_ids:
+        ARTICLES.labels("fetch", client_id).inc(
+            len(newscatcher_data["articles"])
+        )
+
+    if not newscatcher_data["articles"]:
+        logger.warning(
+            "Unfortunately, the actual data in NewsCatcher not found."
+        )
+        return []
+
+    logger.info(
+        f"Found '{len(newscatcher_data['articles'])}' actual news for clients {client_ids} in NewsCatcher"
+    )
+    logger.info("Checking news for exist in previous clients...")
+    with stage_timer("dedup", client_ids[0]) as counts:
+        hashes = MongoDBServices().check_or_add_news(
+            client_id=client_ids[0], news=newscatcher_data["articles"]
+        )
+        if len(client_ids) > 1:
+            MongoDBServices().add_clients_to_news(
+                client_ids=client_ids[1:], hashes=hashes
+            )
+        counts["articles"] = len(hashes)
+    return hashes
+
+
+def send_articles(
+    strategy: SendingStrategy,
+    client_id: str,
+    batches: Iterator[List[Tuple[str, dict]]],
+    output: Optional[dict] = None,
+) -> None:
+    """
+    Send the (hash, article) batches the client has not received yet in
+    the format of its `output` config. Nothing is sent when every article
+    was already delivered.
+    """
+    output_format = strategy.create_output_format(output)
+    first_batch = next(batches, None)
+    if first_batch is None:
+        with stage_timer("send", client_id):
+            strategy.send(
+                "Unfortunately, the actual data for you not found.",
+                output_format,
+            )
+        return
+
+    tracker = DeliveryTracker(client_id)
+    delta = tracker.delta(itertools.chain([first_batch], batches))
+    first_delta = next(delta, None)
+    if first_delta is None:
+        logger.info(
+            f"No new data for client_id '{client_id}', sending skipped."
+        )
+        return
+
+    with stage_timer("send", client_id) as counts:
+        undelivered = strategy.send_stream(
+            count_articles(itertools.chain([first_delta], delta), counts),
+            output_format,
+        )
+        # Rejected news stay pending and are sent again on the next run.
+        tracker.commit(undelivered)
+        counts["skipped"] = tracker.skipped
+        counts["undelivered"] = len(undelivered)
+    if undelivered:
+        logger.warning(
+            f"{len(undelivered)} news for client_id '{client_id}' were not "
+            f"delivered and will be sent again."
+        )
+    ARTICLES.labels("send", client_id).inc(counts.get("articles", 0))
 
 
 @celery_app.task(
@@ -56,22 +393,11 @@ def run_task_chain(**kwargs) -> None:
     retry_backoff_max=60,
 )
 def task_newscatcher_hook(self, **kwargs) -> None:
+    client_ids = kwargs.get("client_ids") or [kwargs["client_id"]]
     newscatcher_params = MongoDBServices().get_specific_client_data(
-        client_id=kwargs["client_id"], data="newscatcher_params"
+        client_id=client_ids[0], data="newscatcher_params"
     )
-    newscatcher_data = HttpHook().newscatcher_hook(params=newscatcher_params)
-    if newscatcher_data["articles"]:
-        logger.info(
-            f"Found '{len(newscatcher_data['articles'])}' actual news for client '{kwargs['client_id']}' in NewsCatcher"
-        )
-        logger.info("Checking news for exist in previous clients...")
-        MongoDBServices().check_or_add_news(
-            client_id=kwargs["client_id"], news=newscatcher_data["articles"]
-        )
-    else:
-        logger.warning(
-            "Unfortunately, the actual data in NewsCatcher not found."
-        )
+    fetch_news(client_ids, newscatcher_params)
 
 
 @celery_app.task(
@@ -90,19 +416,20 @@ def task_ml_process_news_data(self, **kwargs) -> None:
     )
 
     if client_data["nlp"]:
-        clients_news = MongoDBServices().get_clients_news(
-            client_id=kwargs["client_id"], nlp=client_data["nlp"]
+        clients_news = MongoDBServices().get_pending_news(
+            client_id=kwargs["client_id"]
         )
         if clients_news:
             NlpProcesData(
                 clients_news=clients_news,
                 code_word=client_data["newscatcher_params"]["q"],
+                client_id=kwargs["client_id"],
             ).handle_articles()
             logger.info(
                 f"Processed with NLP for client '{kwargs['client_id']}' success."
             )
         else:
-            logger.warning("Unfortunately, the actual data for NLP not found.")
+            logger.info("No new news for NLP since the last run.")
     else:
         logger.info(f"Client '{kwargs['client_id']}' not needed NLP.")
 
@@ -119,32 +446,173 @@ def task_send_data(self, **kwargs) -> None:
         client_id=kwargs["client_id"]
     )
     strategy = SendingStrategyFactory().get_strategy(
-        sending_mode=client_data["send_to"], client_id=kwargs["client_id"]
+        sending_mode=client_data["send_to"],
+        client_id=kwargs["client_id"],
     )
 
-    clients_news = MongoDBServices().get_clients_news(
+    clients_news = MongoDBServices().iter_clients_news(
         client_id=kwargs["client_id"],
         nlp=client_data["nlp"],
         exclude_object_id=True,
+        with_hash=True,
+        dedup=client_data.get("dedup", False),
     )
-    if clients_news:
-        strategy.send(clients_news)
-    else:
-        strategy.send("Unfortunately, the actual data for you not found.")
+    try:
+        send_articles(
+            strategy,
+            kwargs["client_id"],
+            clients_news,
+            client_data.get("output"),
+        )
+    except Exception as e:
+        if not strategy.is_auth_error(e):
+            raise
+        logger.warning(
+            f"Auth error while sending data for client_id "
+            f"'{kwargs['client_id']}', refreshing credentials: {e}"
+        )
+        SendingStrategyFactory.invalidate(kwargs["client_id"])
+        raise self.retry(exc=e, countdown=0)
     logger.info(
         f"Data for client_id '{kwargs['client_id']}' sent and pipeline is finished"
     )
 
 
+@celery_app.task(
+    name="newscatcher_batch",
+    bind=True,
+    retry_backoff=True,
+    max_retries=3,
+    retry_backoff_max=60,
+)
+def task_newscatcher_batch(self, clients: List[dict]) -> List[dict]:
+    groups = defaultdict(list)
+    for client in clients:
+        params_key = normalize_newscatcher_params(client["newscatcher_params"])
+        groups[params_key].append(client)
+    # A retry refetches nothing: finished groups are in the fetch cache.
+    for group_clients in groups.values():
+        fetch_news(
+            [client["client_id"] for client in group_clients],
+            group_clients[0]["newscatcher_params"],
+        )
+
+    hashes = MongoDBServices().get_clients_news_hashes(
+        [client["client_id"] for client in clients]
+    )
+    logger.info(
+        f"Fetched news for {len(clients)} clients in {len(groups)} groups."
+    )
+    return [
+        {**client, "hashes": hashes[client["client_id"]]} for client in clients
+    ]
+
+
+@celery_app.task(
+    name="ml_process_news_batch",
+    bind=True,
+    retry_backoff=True,
+    max_retries=5,
+    retry_backoff_max=120,
+)
+def task_ml_process_news_batch(self, clients: List[dict]) -> List[dict]:
+    # A shared article gets the code word of the first client it belongs
+    # to, like in the per-client pipeline where the first NLP task wins.
+    code_words = {}
+    for client in clients:
+        if client["nlp"]:
+            for key in client["hashes"]:
+                code_words.setdefault(key, client["code_word"])
+    if not code_words:
+        logger.info(f"No news for NLP in a batch of {len(clients)} clients.")
+        return clients
+
+    code_word_news = defaultdict(list)
+    for article in MongoDBServices().get_pending_news(hashes=list(code_words)):
+        code_word_news[code_words[article["hash"]]].append(article)
+    for code_word, clients_news in code_word_news.items():
+        NlpProcesData(
+            clients_news=clients_news, code_word=code_word
+        ).handle_articles()
+    logger.info(
+        f"Processed with NLP {sum(map(len, code_word_news.values()))} new "
+        f"of {len(code_words)} unique news of {len(clients)} clients."
+    )
+    return clients
+
+
+@celery_app.task(
+    name="send_data_batch",
+    bind=True,
+    retry_backoff=True,
+    max_retries=3,
+    retry_backoff_max=60,
+)
+def task_send_data_batch(self, clients: List[dict]) -> None:
+    clusters = {}
+    if any(client.get("dedup") for client in clients):
+        clusters = MongoDBServices().get_news_clusters(
+            list({key for client in clients for key in client["hashes"]})
+        )
+
+    failed, error = [], None
+    for client in clients:
+        client_hashes = client["hashes"]
+        if client.get("dedup"):
+            client_hashes = first_of_clusters(client_hashes, clusters, set())
+        # Articles are read while they are sent, one batch at a time.
+        batches = MongoDBServices().iter_news_by_hashes(
+            client_hashes, nlp=client["nlp"], exclude_object_id=True
+        )
+
+        strategy = None
+        try:
+            strategy = SendingStrategyFactory().get_strategy(
+                sending_mode=client["send_to"],
+                client_id=client["client_id"],
+            )
+            send_articles(
+                strategy, client["client_id"], batches, client["output"]
+            )
+        except Exception as e:
+            logger.error(
+                f"Data for client_id '{client['client_id']}' not sent: {e}"
+            )
+            if strategy is not None and strategy.is_auth_error(e):
+                SendingStrategyFactory.invalidate(client["client_id"])
+            failed.append(client)
+            error = e
+    # Only the clients that failed are sent again, explicit retries get
+    # the same backoff as autoretries.
+    if failed:
+        raise self.retry(
+            args=(failed,),
+            exc=error,
+            countdown=get_exponential_backoff_interval(
+                factor=int(self.retry_backoff),
+                retries=self.request.retries,
+                maximum=self.retry_backoff_max,
+                full_jitter=True,
+            ),
+        )
+    logger.info(
+        f"Data for {len(clients)} clients sent and pipeline is finished"
+    )
+
+
 # @task_success.connect(sender=task_quality_check)
 # def task_success_handler(sender, result, **kwargs) -> None:
 #     logger.info("Signal calls, that mean quality_check is SUCCESS")
 
 
 @task_failure.connect(sender=run_task_chain)
+@task_failure.connect(sender=task_dispatch_due_clients)
 @task_failure.connect(sender=task_newscatcher_hook)
 @task_failure.connect(sender=task_ml_process_news_data)
 @task_failure.connect(sender=task_send_data)
+@task_failure.connect(sender=task_newscatcher_batch)
+@task_failure.connect(sender=task_ml_process_news_batch)
+@task_failure.connect(sender=task_send_data_batch)
 def task_failure_handler(
     sender=None,
     task_id=None,
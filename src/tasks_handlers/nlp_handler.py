@@ -1,33 +1,105 @@
-from typing import List, Tuple
+from collections import defaultdict
+from typing import List, Optional, Tuple
 
+from loguru import logger
+
+from src.metrics import ARTICLES, SENTENCES, stage_timer
 from src.utils import ClusterizationSentences, DefineSentiment, MongoDBServices
 
 
 class NlpProcesData:
-    def __init__(self, clients_news: List[dict], code_word: str):
+    def __init__(
+        self,
+        clients_news: List[dict],
+        code_word: str,
+        client_id: Optional[str] = None,
+    ):
         self.clients_news = clients_news
         self.code_word = code_word
+        self.client_id = client_id
         self.db_service = MongoDBServices()
         self.cluster_service = ClusterizationSentences()
         self.sentiment_service = DefineSentiment()
 
     def handle_articles(self) -> None:
+        """
+        Define sentiment once per near duplicates cluster: members share
+        the sentiment of a member processed with the same code word or of
+        the first pending one.
+        """
+        clusters = defaultdict(list)
         for article in self.clients_news:
-            if "sentiment" in article:
-                continue
+            if "sentiment" not in article:
+                key = article.get("cluster_id") or article["_id"]
+                clusters[key].append(article)
+        if not clusters:
+            return
 
-            sentiments_list = self.process_article(
-                article["content"], self.code_word
+        # News stored without clustering are keyed by their ObjectId.
+        cluster_ids = [key for key in clusters if isinstance(key, str)]
+        sentiments = {}
+        if cluster_ids:
+            sentiments = self.db_service.get_clusters_sentiment(
+                cluster_ids, self.code_word
+            )
+        pending = [key for key in clusters if key not in sentiments]
+        if pending:
+            sentiments.update(
+                zip(
+                    pending,
+                    self.process_articles(
+                        [clusters[key][0].get("content") for key in pending],
+                        self.code_word,
+                    ),
+                )
+            )
+        shared = sum(len(clusters[key]) for key in clusters) - len(pending)
+        if shared:
+            logger.info(
+                f"Sentiment of {shared} near duplicate news shared within "
+                f"their clusters."
             )
-            self.db_service.update_article_sentiment(
-                article["_id"], sentiments_list
+
+        self.db_service.update_articles_sentiment(
+            {
+                article["_id"]: sentiments[key]
+                for key, articles in clusters.items()
+                for article in articles
+            },
+            self.code_word,
+        )
+
+    def process_articles(
+        self, articles: List[Optional[str]], code_word: str
+    ) -> List[List[Tuple]]:
+        """
+        Collect the code word sentences of all articles and define their
+        sentiment in batches. Result item N belongs to article N.
+        """
+        article_indexes, sentences = [], []
+        with stage_timer("segmentation", self.client_id) as counts:
+            for idx, sents in enumerate(
+                self.cluster_service.get_code_word_sentences(
+                    articles, code_word
+                )
+            ):
+                article_indexes.extend([idx] * len(sents))
+                sentences.extend(sents)
+            counts.update(articles=len(articles), sentences=len(sentences))
+        ARTICLES.labels("nlp", self.client_id or "").inc(len(articles))
+        SENTENCES.labels(self.client_id or "").inc(len(sentences))
+
+        with stage_timer("inference", self.client_id) as counts:
+            sentiments = self.sentiment_service.process_batch(texts=sentences)
+            counts["sentences"] = len(sentences)
+        if self.sentiment_service.cache is not None:
+            logger.info(
+                f"Sentiment cache stats: {self.sentiment_service.cache.stats()}"
             )
 
-    def process_article(self, article: str, code_word: str) -> List[Tuple]:
-        sentiments_list = []
-        sents = self.cluster_service.get_clusters(article_text=article)
-        for sent in sents:
-            if code_word.lower() in sent.lower():
-                sentiment = self.sentiment_service.process_text(text=sent)
-                sentiments_list.append((sent, sentiment))
-        return sentiments_list
+        sentiments_lists = [[] for _ in articles]
+        for idx, sent, sentiment in zip(
+            article_indexes, sentences, sentiments
+        ):
+            sentiments_lists[idx].append((sent, sentiment))
+        return sentiments_lists
@@ -1,86 +1,450 @@
-import json
+import base64
+import threading
 import time
 from abc import ABC, abstractmethod
+from typing import Dict, Iterable, List, Optional, Tuple, Type
 
 import boto3
+from botocore.exceptions import ClientError
+from google.api_core.exceptions import PermissionDenied, Unauthenticated
 from google.cloud import pubsub_v1
 from loguru import logger
 
+from src.constants import (
+    PUBSUB_MAX_MESSAGE_SIZE,
+    S3_MULTIPART_CHUNK_SIZE,
+    SENDING_STRATEGY_CACHE_TTL,
+    SQS_MAX_MESSAGE_SIZE,
+)
+from src.metrics import BYTES_SENT
+from src.output_formats import OutputFormat
 from src.utils import SecretsManager
 
 
 class SendingStrategy(ABC):
-    def __init__(self, client_id: str):
+    sending_mode: str
+    default_format: str = "json"
+    output_formats: Tuple[str, ...] = ("json", "ndjson")
+    auth_error_codes: frozenset = frozenset(
+        {
+            "AccessDenied",
+            "AccessDeniedException",
+            "ExpiredToken",
+            "InvalidAccessKeyId",
+            "InvalidClientTokenId",
+            "SignatureDoesNotMatch",
+            "UnrecognizedClientException",
+        }
+    )
+
+    def __init__(
+        self,
+        client_id: str,
+        credentials: Optional[Dict] = None,
+        credentials_version: Optional[str] = None,
+    ):
         self.client_id = client_id
-        self.credentials = self.load_env
+        if credentials is None:
+            secrets_manager = SecretsManager()
+            (
+                credentials,
+                credentials_version,
+            ) = secrets_manager.get_secret_with_version(client_id)
+        self.credentials = credentials
+        self.credentials_version = credentials_version
+        self._client = None
+
+    @classmethod
+    def create_output_format(cls, output: Optional[Dict]) -> OutputFormat:
+        """
+        Output format of a client config, passed to every send call since
+        one cached strategy serves concurrent sends.
+        """
+        return OutputFormat.from_config(
+            output, cls.default_format, cls.output_formats
+        )
 
     @property
-    def load_env(self):
-        return SecretsManager().get_secret(self.client_id)
+    def client(self):
+        """
+        SDK client built once per strategy, so its connection pool is
+        reused while the strategy stays cached.
+        """
+        if self._client is None:
+            self._client = self.create_client()
+        return self._client
 
     @abstractmethod
-    def send(self, data):
+    def create_client(self):
         pass
 
+    def count_bytes(self, size: int) -> None:
+        BYTES_SENT.labels(self.client_id, self.sending_mode).inc(size)
+
+    def is_auth_error(self, exc: Exception) -> bool:
+        if isinstance(exc, ClientError):
+            return exc.response["Error"]["Code"] in self.auth_error_codes
+        return False
+
+    @abstractmethod
+    def send(self, data, output_format: OutputFormat):
+        pass
+
+    @abstractmethod
+    def send_stream(
+        self, batches: Iterable[List[Dict]], output_format: OutputFormat
+    ) -> List[Dict]:
+        """
+        Send streamed documents, returns the documents that were not
+        delivered.
+        """
+
 
 class SQSSendStrategy(SendingStrategy):
-    def send(self, data):
-        sqs = boto3.client(
+    sending_mode = "sqs"
+    # Reserved for message attributes, they count towards the size limit.
+    attributes_size: int = 1024
+
+    def create_client(self):
+        return boto3.client(
             "sqs",
             aws_access_key_id=self.credentials["access_key_id"],
             aws_secret_access_key=self.credentials["secret_access_key"],
             region_name=self.credentials["region"],
         )
-        response = sqs.send_message(
+
+    def message_attributes(self, output_format: OutputFormat) -> Dict:
+        attributes = {
+            "ContentType": {
+                "DataType": "String",
+                "StringValue": output_format.content_type,
+            }
+        }
+        if output_format.content_encoding:
+            attributes["ContentEncoding"] = {
+                "DataType": "String",
+                "StringValue": output_format.content_encoding,
+            }
+        return attributes
+
+    @staticmethod
+    def message_body(data: bytes, output_format: OutputFormat) -> str:
+        # SQS bodies are text, compressed payloads are sent as base64.
+        if output_format.content_encoding:
+            return base64.b64encode(data).decode("ascii")
+        return data.decode("utf-8")
+
+    def send(self, data, output_format: OutputFormat):
+        message_format = output_format.message_format
+        body = self.message_body(
+            output_format.encode_message(data), message_format
+        )
+        response = self.client.send_message(
             QueueUrl=self.credentials["queue_url"],
-            MessageBody=json.dumps(data),
+            MessageBody=body,
+            MessageAttributes=self.message_attributes(message_format),
         )
+        self.count_bytes(len(body))
         logger.info(f"Message sent to SQS: {response}")
 
+    def send_stream(
+        self, batches: Iterable[List[Dict]], output_format: OutputFormat
+    ) -> List[Dict]:
+        max_size = SQS_MAX_MESSAGE_SIZE - self.attributes_size
+        if output_format.content_encoding:
+            # Room for base64 even if the payload does not compress.
+            max_size = max_size * 3 // 4 - 64
+
+        attributes = self.message_attributes(output_format)
+        undelivered, entries_docs = [], []
+        sent, entries, entries_size = 0, [], 0
+        for payload, docs in output_format.pack(
+            batches, max_size, undelivered
+        ):
+            body = self.message_body(
+                output_format.compress(payload), output_format
+            )
+            # One send_message_batch call holds 10 messages and 256 KB total.
+            size = len(body) + self.attributes_size
+            if entries and (
+                len(entries) == 10
+                or entries_size + size > SQS_MAX_MESSAGE_SIZE
+            ):
+                sent += self._send_batch(entries, entries_docs, undelivered)
+                entries, entries_size, entries_docs = [], 0, []
+            entries_docs.append(docs)
+            entries.append(
+                {
+                    "Id": str(len(entries)),
+                    "MessageBody": body,
+                    "MessageAttributes": attributes,
+                }
+            )
+            entries_size += size
+        if entries:
+            sent += self._send_batch(entries, entries_docs, undelivered)
+        logger.info(f"{sent} messages sent to SQS.")
+        return undelivered
+
+    def _send_batch(
+        self,
+        entries: List[Dict],
+        entries_docs: List[List[Dict]],
+        undelivered: List[Dict],
+    ) -> int:
+        """
+        Send up to 10 messages, documents of the messages SQS did not
+        accept are appended to `undelivered`.
+        """
+        response = self.client.send_message_batch(
+            QueueUrl=self.credentials["queue_url"], Entries=entries
+        )
+        if response.get("Failed"):
+            logger.error(f"Messages not sent to SQS: {response['Failed']}")
+        successful = {item["Id"] for item in response.get("Successful", [])}
+        for entry, docs in zip(entries, entries_docs):
+            if entry["Id"] not in successful:
+                undelivered.extend(docs)
+        self.count_bytes(
+            sum(
+                len(entry["MessageBody"])
+                for entry in entries
+                if entry["Id"] in successful
+            )
+        )
+        return len(successful)
+
 
 class S3SendStrategy(SendingStrategy):
-    def send(self, data):
-        s3 = boto3.client(
+    sending_mode = "s3_path"
+    default_format = "ndjson"
+    output_formats = ("json", "ndjson", "parquet")
+
+    def create_client(self):
+        return boto3.client(
             "s3",
             aws_access_key_id=self.credentials["access_key_id"],
             aws_secret_access_key=self.credentials["secret_access_key"],
             region_name=self.credentials["region"],
         )
-        response = s3.put_object(
+
+    @staticmethod
+    def object_metadata(output_format: OutputFormat) -> Dict:
+        metadata = {"ContentType": output_format.content_type}
+        if output_format.content_encoding:
+            metadata["ContentEncoding"] = output_format.content_encoding
+        return metadata
+
+    def send(self, data, output_format: OutputFormat):
+        message_format = output_format.message_format
+        body = output_format.encode_message(data)
+        response = self.client.put_object(
             Bucket=self.credentials["bucket_name"],
-            Key=f"data_{int(time.time())}.json",
-            Body=json.dumps(data),
+            Key=f"data_{int(time.time())}.{message_format.extension}",
+            Body=body,
+            **self.object_metadata(message_format),
         )
+        self.count_bytes(len(body))
         logger.info(f"Data uploaded to S3: {response}")
 
+    def send_stream(
+        self, batches: Iterable[List[Dict]], output_format: OutputFormat
+    ) -> List[Dict]:
+        # One object holds every document, the upload fails as a whole.
+        s3 = self.client
+        bucket, key = (
+            self.credentials["bucket_name"],
+            f"data_{int(time.time())}.{output_format.extension}",
+        )
+        upload = s3.create_multipart_upload(
+            Bucket=bucket, Key=key, **self.object_metadata(output_format)
+        )
+
+        parts, buffer = [], bytearray()
+        try:
+            # Parts are cut from the compressed stream, so every part but
+            # the last one keeps the S3 minimum size.
+            for piece in output_format.stream(batches):
+                buffer += piece
+                while len(buffer) >= S3_MULTIPART_CHUNK_SIZE:
+                    parts.append(
+                        self._upload_part(
+                            s3,
+                            upload,
+                            parts,
+                            bytes(buffer[:S3_MULTIPART_CHUNK_SIZE]),
+                        )
+                    )
+                    del buffer[:S3_MULTIPART_CHUNK_SIZE]
+            if buffer or not parts:
+                parts.append(
+                    self._upload_part(s3, upload, parts, bytes(buffer))
+                )
+
+            response = s3.complete_multipart_upload(
+                Bucket=bucket,
+                Key=key,
+                UploadId=upload["UploadId"],
+                MultipartUpload={"Parts": parts},
+            )
+        except Exception:
+            s3.abort_multipart_upload(
+                Bucket=bucket, Key=key, UploadId=upload["UploadId"]
+            )
+            raise
+        logger.info(f"Data uploaded to S3 in {len(parts)} parts: {response}")
+        return []
+
+    def _upload_part(self, s3, upload: Dict, parts: List, body: bytes) -> Dict:
+        part_number = len(parts) + 1
+        response = s3.upload_part(
+            Bucket=upload["Bucket"],
+            Key=upload["Key"],
+            UploadId=upload["UploadId"],
+            PartNumber=part_number,
+            Body=body,
+        )
+        self.count_bytes(len(body))
+        return {"ETag": response["ETag"], "PartNumber": part_number}
+
 
 class GooglePubSubSendStrategy(SendingStrategy):
-    def send(self, data):
-        # TODO: ! (adding 'topic_id' to env)
-        publisher_data = pubsub_v1.PublisherClient.from_service_account_json(
+    sending_mode = "pub_sub"
+
+    def create_client(self):
+        return pubsub_v1.PublisherClient.from_service_account_info(
             self.credentials
         )
-        publisher = json.loads(publisher_data)
-        topic_path = publisher.topic_path(
+
+    @property
+    def topic_path(self) -> str:
+        # TODO: ! (adding 'topic_id' to env)
+        return self.client.topic_path(
             self.credentials["project_id"], self.credentials["topic_id"]
         )
-        data = json.dumps(data).encode("utf-8")
-        response = publisher.publish(topic_path, data)
+
+    @staticmethod
+    def message_attributes(output_format: OutputFormat) -> Dict[str, str]:
+        attributes = {"content_type": output_format.content_type}
+        if output_format.content_encoding:
+            attributes["content_encoding"] = output_format.content_encoding
+        return attributes
+
+    def is_auth_error(self, exc: Exception) -> bool:
+        return isinstance(exc, (Unauthenticated, PermissionDenied))
+
+    def send(self, data, output_format: OutputFormat):
+        data = output_format.encode_message(data)
+        response = self.client.publish(
+            self.topic_path,
+            data,
+            **self.message_attributes(output_format.message_format),
+        )
         logger.info(f"Message sent to Google Pub/Sub: {response.result()}")
+        self.count_bytes(len(data))
+
+    def send_stream(
+        self, batches: Iterable[List[Dict]], output_format: OutputFormat
+    ) -> List[Dict]:
+        topic_path = self.topic_path
+        attributes = self.message_attributes(output_format)
+        futures, size, undelivered = [], 0, []
+        for payload, _ in output_format.pack(
+            batches, PUBSUB_MAX_MESSAGE_SIZE, undelivered
+        ):
+            data = output_format.compress(payload)
+            futures.append(self.client.publish(topic_path, data, **attributes))
+            size += len(data)
+        message_ids = [future.result() for future in futures]
+        self.count_bytes(size)
+        logger.info(
+            f"{len(message_ids)} messages sent to Google Pub/Sub: "
+            f"{message_ids}"
+        )
+        return undelivered
 
 
 class SendingStrategyFactory:
-    @staticmethod
+    """
+    Per-process cache of sending strategies keyed by client and sending
+    mode. Entries live for SENDING_STRATEGY_CACHE_TTL seconds, after that
+    the secret is fetched again and the strategy (with its SDK client) is
+    kept when the secret version did not change. The secret is fetched
+    outside the lock, so a slow Secrets Manager call of one client never
+    blocks the others.
+    """
+
+    strategies: Dict[str, Type[SendingStrategy]] = {
+        "sqs": SQSSendStrategy,
+        "s3_path": S3SendStrategy,
+        "pub_sub": GooglePubSubSendStrategy,
+    }
+    _cache: Dict[Tuple[str, str], Tuple[SendingStrategy, float]] = {}
+    _lock = threading.Lock()
+
+    @classmethod
     def get_strategy(
+        cls,
         client_id: str,
         sending_mode: str,
     ) -> SendingStrategy:
-        strategies = {
-            "sqs": SQSSendStrategy,
-            "s3_path": S3SendStrategy,
-            "pub_sub": GooglePubSubSendStrategy,
-        }
-        strategy_class = strategies.get(sending_mode)
+        strategy_class = cls.strategies.get(sending_mode)
         if not strategy_class:
             raise ValueError(f"Unknown sort mode: {sending_mode}")
-        return strategy_class(client_id=client_id)
+
+        key = (client_id, sending_mode)
+        with cls._lock:
+            now = time.monotonic()
+            cls._evict_expired(now)
+            cached = cls._cache.get(key)
+            if cached and cached[1] > now:
+                return cached[0]
+
+        credentials, version = SecretsManager().get_secret_with_version(
+            client_id
+        )
+        with cls._lock:
+            # Another thread may have refreshed the entry meanwhile.
+            cached = cls._cache.get(key)
+            if (
+                cached
+                and version is not None
+                and cached[0].credentials_version == version
+            ):
+                cls._cache[key] = (
+                    cached[0],
+                    time.monotonic() + SENDING_STRATEGY_CACHE_TTL,
+                )
+                return cached[0]
+
+        strategy = strategy_class(
+            client_id=client_id,
+            credentials=credentials,
+            credentials_version=version,
+        )
+        logger.info(
+            f"Sending strategy '{sending_mode}' for client_id "
+            f"'{client_id}' created (secret version {version})."
+        )
+        if credentials is not None:
+            with cls._lock:
+                cls._cache[key] = (
+                    strategy,
+                    time.monotonic() + SENDING_STRATEGY_CACHE_TTL,
+                )
+        return strategy
+
+    @classmethod
+    def invalidate(cls, client_id: str) -> None:
+        with cls._lock:
+            for key in [key for key in cls._cache if key[0] == client_id]:
+                del cls._cache[key]
+        logger.info(f"Sending strategies of client_id '{client_id}' dropped.")
+
+    @classmethod
+    def _evict_expired(cls, now: float) -> None:
+        # Expired entries are kept for one more TTL so that an unchanged
+        # secret version can reuse them, then dropped.
+        for key, (_, expires_at) in list(cls._cache.items()):
+            if expires_at + SENDING_STRATEGY_CACHE_TTL < now:
+                del cls._cache[key]
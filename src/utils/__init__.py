@@ -1 +1,5 @@
+from .inference import *
+from .near_duplicates import *
+from .newscatcher import *
+from .sentiment_cache import *
 from .utils import *
@@ -0,0 +1,89 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Tuple
+
+from loguru import logger
+from singleton_decorator import singleton
+
+from src.constants import INFERENCE_MAX_BATCH_SIZE, INFERENCE_MAX_WAIT_MS
+
+
+@singleton
+class InferenceEngine:
+    """
+    In-process inference server for the cpu-worker. Celery threads submit
+    sentences to one queue, a single background thread merges concurrent
+    requests into dynamic batches of up to INFERENCE_MAX_BATCH_SIZE
+    sentences and resolves each request with its own labels.
+    """
+
+    def __init__(self, infer: Callable[[List[str]], List[str]]):
+        self.infer = infer
+        self.max_batch_size = INFERENCE_MAX_BATCH_SIZE
+        self.max_wait = INFERENCE_MAX_WAIT_MS / 1000
+        self._queue: queue.Queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, texts: List[str]) -> Future:
+        self._ensure_started()
+        future = Future()
+        if not texts:
+            future.set_result([])
+        else:
+            self._queue.put((texts, future))
+        return future
+
+    def _ensure_started(self) -> None:
+        # Threads do not survive fork, a forked child starts its own one.
+        with self._lock:
+            if self._thread is None or self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(
+                    target=self._serve, name="inference-engine", daemon=True
+                )
+                self._pid = os.getpid()
+                self._thread.start()
+                logger.info("Inference engine started.")
+
+    def _serve(self) -> None:
+        while True:
+            requests = self._collect_batch()
+            texts = [
+                text for request_texts, _ in requests for text in request_texts
+            ]
+            try:
+                labels = self.infer(texts)
+            except Exception as e:
+                for _, future in requests:
+                    future.set_exception(e)
+                continue
+
+            offset = 0
+            for request_texts, future in requests:
+                future.set_result(labels[offset : offset + len(request_texts)])
+                offset += len(request_texts)
+            logger.info(
+                f"Inference engine batch: {len(texts)} sentences "
+                f"from {len(requests)} requests."
+            )
+
+    def _collect_batch(self) -> List[Tuple[List[str], Future]]:
+        requests = [self._queue.get()]
+        size = len(requests[0][0])
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                break
+            requests.append(request)
+            size += len(request[0])
+        return requests
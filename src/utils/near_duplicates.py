@@ -0,0 +1,193 @@
+import hashlib
+import re
+from collections import defaultdict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from loguru import logger
+from pymongo import UpdateOne
+
+from src.constants import (
+    MONGO_COLLECTION_NEWS,
+    NEAR_DUPLICATES_BANDS,
+    NEAR_DUPLICATES_DISTANCE,
+)
+from src.db import MongoDBInit
+from src.dependencies import DependencyManager
+
+SIMHASH_BITS = 64
+SHINGLE_SIZE = 3
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def simhash(text: Optional[str], shingle_size: int = SHINGLE_SIZE) -> int:
+    """
+    64-bit SimHash of the word shingles of `text`. Reprints of a story
+    differ in a few bits, 0 means there is nothing to hash.
+    """
+    words = _WORD_RE.findall((text or "").lower())
+    shingles = {
+        " ".join(words[idx : idx + shingle_size])
+        for idx in range(max(1, len(words) - shingle_size + 1))
+    }
+    shingles.discard("")
+    if not shingles:
+        return 0
+
+    # Bits are counted column-wise over binary strings, much faster than
+    # shifting every shingle hash once per bit.
+    rows = [
+        format(
+            int.from_bytes(
+                hashlib.blake2b(
+                    shingle.encode("utf-8"), digest_size=SIMHASH_BITS // 8
+                ).digest(),
+                "big",
+            ),
+            f"0{SIMHASH_BITS}b",
+        )
+        for shingle in shingles
+    ]
+    half = len(rows) / 2
+    return int(
+        "".join(
+            "1" if column.count("1") > half else "0"
+            for column in map("".join, zip(*rows))
+        ),
+        2,
+    )
+
+
+def simhash_bands(value: int, bands: int = NEAR_DUPLICATES_BANDS) -> List[str]:
+    """
+    Split a SimHash into `bands` buckets. Hashes within a distance below
+    `bands` share at least one bucket.
+    """
+    width = SIMHASH_BITS // bands
+    mask = (1 << width) - 1
+    return [
+        f"{band}:{(value >> (band * width)) & mask:x}" for band in range(bands)
+    ]
+
+
+def hamming_distance(first: int, second: int) -> int:
+    return (first ^ second).bit_count()
+
+
+def first_of_clusters(
+    hashes: Iterable[str], clusters: Dict[str, str], seen: Set[str]
+) -> List[str]:
+    """
+    Keep the first news of every cluster not in `seen`, news without a
+    cluster are their own cluster.
+    """
+    kept = []
+    for key in hashes:
+        cluster_id = clusters.get(key) or key
+        if cluster_id not in seen:
+            seen.add(cluster_id)
+            kept.append(key)
+    return kept
+
+
+class NearDuplicateIndex:
+    """
+    Clusters reprints of the same story. News get their SimHash, its band
+    buckets and a `cluster_id`: the hash of the first stored news within
+    `max_distance` bits, or their own hash.
+    """
+
+    def __init__(
+        self,
+        connection: Optional[MongoDBInit] = None,
+        max_distance: int = NEAR_DUPLICATES_DISTANCE,
+        bands: int = NEAR_DUPLICATES_BANDS,
+    ):
+        if max_distance >= bands:
+            logger.warning(
+                f"Near duplicates within {max_distance} bits may be missed "
+                f"with {bands} bands, use more bands than the distance."
+            )
+        connection = connection or DependencyManager().mongodb_connection
+        self.collection = connection.get_collection(MONGO_COLLECTION_NEWS)
+        self.max_distance = max_distance
+        self.bands = bands
+
+    def assign_clusters(
+        self, contents: Dict[str, Optional[str]]
+    ) -> Dict[str, str]:
+        """
+        Store SimHash and cluster of news inserted with the given bodies.
+        Returns their cluster ids.
+        """
+        if not contents:
+            return {}
+        fingerprints = {key: simhash(text) for key, text in contents.items()}
+        bands = {
+            key: simhash_bands(value, self.bands)
+            for key, value in fingerprints.items()
+            if value
+        }
+
+        buckets = self._candidates(
+            {band for item in bands.values() for band in item},
+            exclude=list(contents),
+        )
+
+        clusters, operations = {}, []
+        for key, value in fingerprints.items():
+            cluster_id = self._nearest_cluster(value, bands.get(key), buckets)
+            clusters[key] = cluster_id or key
+            fields = {"cluster_id": clusters[key]}
+            if value:
+                fields.update(
+                    simhash=f"{value:016x}", simhash_bands=bands[key]
+                )
+                # Later news of the same call match earlier ones.
+                for band in bands[key]:
+                    buckets[band].append((value, clusters[key]))
+            operations.append(UpdateOne({"hash": key}, {"$set": fields}))
+        self.collection.bulk_write(operations, ordered=False)
+
+        duplicates = sum(
+            cluster_id != key for key, cluster_id in clusters.items()
+        )
+        if duplicates:
+            logger.info(
+                f"{duplicates} of {len(clusters)} new news are near "
+                f"duplicates of stored ones."
+            )
+        return clusters
+
+    def _candidates(
+        self, wanted: Set[str], exclude: List[str]
+    ) -> Dict[str, List[Tuple[int, str]]]:
+        buckets: Dict[str, List[Tuple[int, str]]] = defaultdict(list)
+        if not wanted:
+            return buckets
+        for doc in self.collection.find(
+            {
+                "simhash_bands": {"$in": list(wanted)},
+                "hash": {"$nin": exclude},
+            },
+            {"simhash": 1, "simhash_bands": 1, "cluster_id": 1, "_id": 0},
+        ):
+            for band in doc["simhash_bands"]:
+                buckets[band].append(
+                    (int(doc["simhash"], 16), doc["cluster_id"])
+                )
+        return buckets
+
+    def _nearest_cluster(
+        self,
+        value: int,
+        bands: Optional[List[str]],
+        buckets: Dict[str, List[Tuple[int, str]]],
+    ) -> Optional[str]:
+        best, best_distance = None, self.max_distance + 1
+        for band in bands or []:
+            for candidate, cluster_id in buckets.get(band, []):
+                distance = hamming_distance(value, candidate)
+                if distance < best_distance:
+                    best, best_distance = cluster_id, distance
+        return best
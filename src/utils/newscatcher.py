@@ -0,0 +1,185 @@
+import asyncio
+import json
+import time
+from typing import Dict, List, Optional
+
+import httpx
+from loguru import logger
+from singleton_decorator import singleton
+
+from src.constants import (
+    NEWSCATCHER_API_KEY,
+    NEWSCATCHER_CONCURRENCY,
+    NEWSCATCHER_MAX_PAGES,
+    NEWSCATCHER_MAX_RETRIES,
+    NEWSCATCHER_PAGE_SIZE,
+    NEWSCATCHER_RATE_LIMIT,
+    NEWSCATCHER_SOURCES_SHARD_SIZE,
+)
+from src.db import article_hash
+
+
+def normalize_newscatcher_params(params: dict) -> str:
+    """
+    Canonical form of NewsCatcher params: equal searches of different
+    clients give the same string whatever the order of their sources.
+    """
+    normalized = dict(params)
+    if isinstance(normalized.get("sources"), list):
+        normalized["sources"] = sorted(
+            {source.lower() for source in normalized["sources"]}
+        )
+    return json.dumps(normalized, sort_keys=True)
+
+
+class TokenBucket:
+    """
+    Paces requests to `rate` per second with bursts up to `capacity`.
+    State is plain numbers, so one bucket is shared by every event loop
+    of the process.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[int] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1, int(rate))
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._paused_until = 0.0
+
+    async def acquire(self) -> None:
+        while True:
+            now = time.monotonic()
+            if now < self._paused_until:
+                await asyncio.sleep(self._paused_until - now)
+                continue
+
+            self._tokens = min(
+                self.capacity,
+                self._tokens + (now - self._updated_at) * self.rate,
+            )
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def pause(self, seconds: float) -> None:
+        self._paused_until = max(
+            self._paused_until, time.monotonic() + seconds
+        )
+        self._tokens = 0.0
+
+
+@singleton
+class AsyncNewsCatcherFetcher:
+    """
+    Fetch every page of a NewsCatcher search. Large `sources` lists are
+    split into shards fetched concurrently, requests are paced by a token
+    bucket and 429 responses pause it for `Retry-After` seconds. Transport
+    errors and 5xx responses are retried with the same backoff.
+    """
+
+    URL: str = "https://v3-api.newscatcherapi.com/api/search"
+
+    def __init__(self):
+        self.concurrency = NEWSCATCHER_CONCURRENCY
+        self.shard_size = NEWSCATCHER_SOURCES_SHARD_SIZE
+        self.max_pages = NEWSCATCHER_MAX_PAGES
+        self.max_retries = NEWSCATCHER_MAX_RETRIES
+        self.bucket = TokenBucket(rate=NEWSCATCHER_RATE_LIMIT)
+        # Replaced by a stub transport in benchmarks.
+        self.transport: Optional[httpx.AsyncBaseTransport] = None
+
+    async def fetch(self, params: dict) -> Dict:
+        semaphore = asyncio.Semaphore(self.concurrency)
+        async with httpx.AsyncClient(
+            headers={"x-api-token": NEWSCATCHER_API_KEY},
+            timeout=60,
+            transport=self.transport,
+        ) as client:
+            shards_articles = await asyncio.gather(
+                *(
+                    self._fetch_shard(client, semaphore, shard)
+                    for shard in self._shards(params)
+                )
+            )
+
+        articles = {}
+        for shard_articles in shards_articles:
+            for article in shard_articles:
+                key = article_hash(article["title"], article["link"])
+                articles.setdefault(key, article)
+        logger.info(
+            f"Fetched {len(articles)} unique articles from NewsCatcher "
+            f"in {len(shards_articles)} shards."
+        )
+        return {"articles": list(articles.values())}
+
+    def _shards(self, params: dict) -> List[dict]:
+        params = {"page_size": NEWSCATCHER_PAGE_SIZE, **params}
+        sources = params.get("sources")
+        if not isinstance(sources, list) or len(sources) <= self.shard_size:
+            return [params]
+        return [
+            {**params, "sources": sources[start : start + self.shard_size]}
+            for start in range(0, len(sources), self.shard_size)
+        ]
+
+    async def _fetch_shard(
+        self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, params
+    ) -> List[dict]:
+        first_page = await self._get(client, semaphore, {**params, "page": 1})
+        total_pages = min(first_page.get("total_pages") or 1, self.max_pages)
+
+        pages = await asyncio.gather(
+            *(
+                self._get(client, semaphore, {**params, "page": page})
+                for page in range(2, total_pages + 1)
+            )
+        )
+        return [
+            article
+            for page in (first_page, *pages)
+            for article in page.get("articles") or []
+        ]
+
+    async def _get(
+        self, client: httpx.AsyncClient, semaphore: asyncio.Semaphore, params
+    ) -> Dict:
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    await self.bucket.acquire()
+                    response = await client.get(self.URL, params=params)
+            except httpx.TransportError as error:
+                if attempt == self.max_retries:
+                    raise
+                reason = type(error).__name__
+                retry_after = float(2**attempt)
+            else:
+                if (
+                    not self._retryable(response)
+                    or attempt == self.max_retries
+                ):
+                    break
+                reason = f"status {response.status_code}"
+                retry_after = self._retry_after(response, attempt)
+            logger.warning(
+                f"NewsCatcher request failed ({reason}), "
+                f"retrying in {retry_after}s."
+            )
+            self.bucket.pause(retry_after)
+
+        response.raise_for_status()
+        return response.json()
+
+    @staticmethod
+    def _retryable(response: httpx.Response) -> bool:
+        return response.status_code == 429 or response.is_server_error
+
+    @staticmethod
+    def _retry_after(response: httpx.Response, attempt: int) -> float:
+        try:
+            return float(response.headers["Retry-After"])
+        except (KeyError, ValueError):
+            return float(2**attempt)
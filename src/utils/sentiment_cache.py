@@ -0,0 +1,113 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Dict, List
+
+from pymongo import UpdateOne
+from singleton_decorator import singleton
+
+from src.constants import (
+    MONGO_COLLECTION_SENTIMENT_CACHE,
+    SENTIMENT_CACHE_SIZE,
+)
+from src.db import bulk_upsert
+from src.dependencies import DependencyManager
+from src.metrics import CACHE_LOOKUPS
+
+
+@singleton
+class SentimentCache:
+    """
+    Sentence sentiment memoization: an in-process LRU in front of a
+    MongoDB collection. Keys are hashes of the normalized sentence plus
+    model name, resolved model commit and active backend, so neither a
+    model upgrade nor a backend fallback reads stale labels.
+    """
+
+    def __init__(self):
+        connection = DependencyManager().mongodb_connection
+        self.collection = connection.get_collection(
+            MONGO_COLLECTION_SENTIMENT_CACHE
+        )
+        self.max_size = SENTIMENT_CACHE_SIZE
+        self._lru: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"memory_hits": 0, "db_hits": 0, "misses": 0}
+
+    @staticmethod
+    def key(text: str) -> str:
+        # FinBERT is uncased, so case and whitespace do not change the label.
+        normalized = " ".join(text.lower().split())
+        manager = DependencyManager()
+        payload = (
+            f"{manager.sentimental_model}\x1f{manager.model_commit}\x1f"
+            f"{manager.sentiment_backend.name}\x1f{normalized}"
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def lookup(self, keys: List[str]) -> Dict[str, str]:
+        found, missing = {}, []
+        with self._lock:
+            for key in keys:
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    found[key] = self._lru[key]
+                else:
+                    missing.append(key)
+            self._stats["memory_hits"] += len(found)
+        CACHE_LOOKUPS.labels("sentiment", "memory_hit").inc(len(found))
+
+        if missing:
+            for doc in self.collection.find(
+                {"_id": {"$in": missing}}, {"sentiment": 1}
+            ):
+                found[doc["_id"]] = doc["sentiment"]
+            db_hits = len(found) - (len(keys) - len(missing))
+            with self._lock:
+                self._stats["db_hits"] += db_hits
+                self._stats["misses"] += len(missing) - db_hits
+                for key in missing:
+                    if key in found:
+                        self._remember(key, found[key])
+            CACHE_LOOKUPS.labels("sentiment", "db_hit").inc(db_hits)
+            CACHE_LOOKUPS.labels("sentiment", "miss").inc(
+                len(missing) - db_hits
+            )
+        return found
+
+    def store(self, sentiments: Dict[str, str]) -> None:
+        if not sentiments:
+            return
+        with self._lock:
+            for key, sentiment in sentiments.items():
+                self._remember(key, sentiment)
+
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"_id": key},
+                {"$setOnInsert": {"sentiment": sentiment, "created_at": now}},
+                upsert=True,
+            )
+            for key, sentiment in sentiments.items()
+        ]
+        bulk_upsert(self.collection, operations)
+
+    def stats(self) -> Dict[str, float]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._lru)
+        lookups = stats["memory_hits"] + stats["db_hits"] + stats["misses"]
+        stats["hit_rate"] = (
+            (stats["memory_hits"] + stats["db_hits"]) / lookups
+            if lookups
+            else 0.0
+        )
+        return stats
+
+    def _remember(self, key: str, sentiment: str) -> None:
+        self._lru[key] = sentiment
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
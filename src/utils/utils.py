@@ -1,16 +1,65 @@
+import asyncio
 import base64
+import hashlib
 import json
-from datetime import datetime, timedelta
-from typing import Dict, List, Literal, Optional, Union
+import re
+import time
+from datetime import datetime, timedelta, timezone
+from typing import (
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Optional,
+    Pattern,
+    Tuple,
+    Union,
+)
 
-import torch
 from bson import ObjectId
 from loguru import logger
-from pymongo.errors import BulkWriteError
-
-from src.constants import MONGO_COLLECTION_CLIENTS, MONGO_COLLECTION_NEWS
-from src.db import MongoDBInit
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from src.constants import (
+    CODE_WORD_WINDOW_SIZE,
+    DELIVERY_DELTA_ENABLED,
+    INFERENCE_ENGINE_ENABLED,
+    MONGO_BULK_FLUSH_SIZE,
+    MONGO_COLLECTION_CLIENT_ARTICLES,
+    MONGO_COLLECTION_CLIENTS,
+    MONGO_COLLECTION_CONTENT,
+    MONGO_COLLECTION_FETCH_CACHE,
+    MONGO_COLLECTION_NEWS,
+    MONGO_COLLECTION_SCHEDULER,
+    MONGO_STREAM_BATCH_SIZE,
+    NEAR_DUPLICATES_ENABLED,
+    NEWSCATCHER_CACHE_BUCKET,
+    NEWSCATCHER_CACHE_WAIT,
+    SENTIMENT_BATCH_SIZE,
+    SENTIMENT_CACHE_ENABLED,
+    SENTIMENT_SORT_BY_LENGTH,
+    SPACY_PIPE_BATCH_SIZE,
+)
+from src.db import (
+    MongoDBInit,
+    article_hash,
+    bulk_upsert,
+    client_article_operations,
+    content_operations,
+    decode_content,
+)
 from src.dependencies import DependencyManager
+from src.metrics import CACHE_LOOKUPS
+from src.output_formats import dumps
+from src.utils.inference import InferenceEngine
+from src.utils.near_duplicates import NearDuplicateIndex, first_of_clusters
+from src.utils.newscatcher import (
+    AsyncNewsCatcherFetcher,
+    normalize_newscatcher_params,
+)
+from src.utils.sentiment_cache import SentimentCache
 
 
 class MongoDBServices:
@@ -26,6 +75,114 @@ class MongoDBServices:
         )
         return list(clients_collection.find())
 
+    def get_changed_clients(self, since: Optional[datetime]) -> list:
+        """
+        Clients updated since the `since` watermark plus clients that were
+        never scheduled.
+        """
+        clients_collection = self.connection.get_collection(
+            MONGO_COLLECTION_CLIENTS
+        )
+        query = {"next_run_at": {"$exists": False}}
+        if since:
+            query = {"$or": [query, {"updated_at": {"$gte": since}}]}
+        return list(
+            clients_collection.find(
+                query,
+                {
+                    "cron": 1,
+                    "scheduled_cron": 1,
+                    "next_run_at": 1,
+                    "updated_at": 1,
+                },
+            )
+        )
+
+    def update_client(self, client_id: str, changes: dict) -> None:
+        """
+        Change client data, the schedule picks up a changed `cron` on the
+        next dispatcher tick.
+        """
+        clients_collection = self.connection.get_collection(
+            MONGO_COLLECTION_CLIENTS
+        )
+        clients_collection.update_one(
+            {"_id": ObjectId(client_id)},
+            {"$set": changes, "$currentDate": {"updated_at": True}},
+        )
+
+    def get_due_clients(self, now: datetime, limit: int) -> list:
+        clients_collection = self.connection.get_collection(
+            MONGO_COLLECTION_CLIENTS
+        )
+        return list(
+            clients_collection.find(
+                {"next_run_at": {"$lte": now}},
+                {
+                    "cron": 1,
+                    "newscatcher_params": 1,
+                    "next_run_at": 1,
+                    "nlp": 1,
+                    "send_to": 1,
+                    "output": 1,
+                    "dedup": 1,
+                },
+            )
+            .sort("next_run_at", ASCENDING)
+            .limit(limit)
+        )
+
+    def set_clients_schedule(
+        self, next_runs: Dict[ObjectId, Tuple[Optional[datetime], str]]
+    ) -> None:
+        """
+        A None run time unschedules the client: it is neither due nor
+        synced again until its `cron` changes.
+        """
+        if not next_runs:
+            return
+        clients_collection = self.connection.get_collection(
+            MONGO_COLLECTION_CLIENTS
+        )
+        clients_collection.bulk_write(
+            [
+                UpdateOne(
+                    {"_id": client_id},
+                    {"$set": {"next_run_at": run_at, "scheduled_cron": cron}},
+                )
+                for client_id, (run_at, cron) in next_runs.items()
+            ],
+            ordered=False,
+        )
+
+    def get_schedule_watermark(self) -> Optional[datetime]:
+        state = self.connection.get_collection(
+            MONGO_COLLECTION_SCHEDULER
+        ).find_one({"_id": "clients_sync"})
+        return state["watermark"] if state else None
+
+    def set_schedule_watermark(self, watermark: datetime) -> None:
+        self.connection.get_collection(MONGO_COLLECTION_SCHEDULER).update_one(
+            {"_id": "clients_sync"},
+            {"$max": {"watermark": watermark}},
+            upsert=True,
+        )
+
+    def get_last_dispatch(self) -> Optional[datetime]:
+        state = self.connection.get_collection(
+            MONGO_COLLECTION_SCHEDULER
+        ).find_one({"_id": "dispatcher"})
+        if not state:
+            return None
+        return state["last_tick_at"].replace(tzinfo=timezone.utc)
+
+    def set_last_dispatch(self, tick_at: datetime) -> None:
+        self.connection.get_collection(MONGO_COLLECTION_SCHEDULER).update_one(
+            {"_id": "dispatcher"},
+            {"$max": {"last_tick_at": tick_at}},
+            upsert=True,
+        )
+
     def get_specific_client_data(
         self, client_id: str, data: str = None
     ) -> Optional[Union[str, list]]:
@@ -40,47 +197,129 @@ class MongoDBServices:
             return None
         return client_data[data] if data else client_data
 
-    def check_or_add_news(self, client_id: str, news: List[dict]) -> None:
+    def check_or_add_news(self, client_id: str, news: List[dict]) -> List[str]:
+        """
+        Upsert articles by content hash and link them to the client: new
+        ones are inserted, existing ones only get the client edge. No read
+        is made before the write. Bodies go to the content collection, news
+        documents keep the metadata only. New articles are clustered with
+        their near duplicates. Returns hashes of the given articles.
+        """
         news_collection = self.connection.get_collection(MONGO_COLLECTION_NEWS)
 
-        titles_links = [
-            {
-                "article.title": article["title"],
-                "article.link": article["link"],
-            }
-            for article in news
+        now = datetime.utcnow()
+        operations, contents = {}, {}
+        for article in news:
+            key = article_hash(article["title"], article["link"])
+            article = dict(article)
+            contents[key] = article.pop("content", None)
+            operations[key] = UpdateOne(
+                {"hash": key},
+                {
+                    "$setOnInsert": {
+                        "article": article,
+                        "created_at": now,
+                        "nlp_status": "pending",
+                    },
+                },
+                upsert=True,
+            )
+        if not operations:
+            return []
+
+        # Bodies are written first, so every news document has its body.
+        bulk_upsert(
+            self.connection.get_collection(MONGO_COLLECTION_CONTENT),
+            content_operations(contents, now),
+        )
+
+        hashes = list(operations)
+        # Concurrent upserts of the same hash race on the unique index,
+        # the loser's article is already inserted by the winner.
+        inserted = [
+            hashes[idx]
+            for idx in bulk_upsert(news_collection, list(operations.values()))
         ]
-        existing_articles = list(news_collection.find({"$or": titles_links}))
+        logger.info(
+            f"News for client '{client_id}': {len(inserted)} inserted, "
+            f"{len(hashes) - len(inserted)} already exist."
+        )
 
-        existing_articles_dict = {
-            f"{article['article']['title']}_{article['article']['link']}": article
-            for article in existing_articles
-        }
+        if NEAR_DUPLICATES_ENABLED:
+            NearDuplicateIndex(self.connection).assign_clusters(
+                {key: contents[key] for key in inserted}
+            )
 
-        new_articles = []
+        # Edges are written last, so every edge points to a stored news.
+        self.add_clients_to_news(client_ids=[client_id], hashes=hashes)
+        return hashes
 
-        for article in news:
-            key = f"{article['title']}_{article['link']}"
-            if key in existing_articles_dict:
-                existing_article = existing_articles_dict[key]
-                if client_id not in existing_article.get("clients", []):
-                    news_collection.update_one(
-                        {"_id": existing_article["_id"]},
-                        {"$addToSet": {"clients": client_id}},
-                    )
-            else:
-                new_article = {
-                    "article": article,
-                    "clients": [client_id],
-                    "created_at": datetime.utcnow(),
-                }
-                new_articles.append(new_article)
-
-        if new_articles:
-            try:
-                news_collection.insert_many(new_articles)
-            except BulkWriteError as bwe:
-                print(f"Bulk write error: {bwe.details}")
+    def add_clients_to_news(
+        self, client_ids: List[str], hashes: List[str]
+    ) -> None:
+        client_articles_collection = self.connection.get_collection(
+            MONGO_COLLECTION_CLIENT_ARTICLES
+        )
+        bulk_upsert(
+            client_articles_collection,
+            client_article_operations(client_ids, hashes, datetime.utcnow()),
+        )
+        logger.info(f"Clients {client_ids} linked to {len(hashes)} news.")
+
+    @staticmethod
+    def _clients_news_query(client_id: Union[str, dict]) -> dict:
+        """
+        Daily client-news edges of the client (or clients).
+        """
+        start_of_today = datetime.utcnow().replace(
+            hour=0, minute=0, second=0, microsecond=0
+        )
+        end_of_today = start_of_today + timedelta(days=1)
+        return {
+            "client_id": client_id,
+            "created_at": {"$gte": start_of_today, "$lt": end_of_today},
+        }
+
+    def _iter_clients_hashes(
+        self, client_id: Union[str, dict], batch_size: int
+    ) -> Iterator[List[str]]:
+        client_articles_collection = self.connection.get_collection(
+            MONGO_COLLECTION_CLIENT_ARTICLES
+        )
+        hashes = []
+        for doc in client_articles_collection.find(
+            self._clients_news_query(client_id),
+            {"hash": 1, "_id": 0},
+            batch_size=batch_size,
+        ):
+            hashes.append(doc["hash"])
+            if len(hashes) >= batch_size:
+                yield hashes
+                hashes = []
+        if hashes:
+            yield hashes
+
+    def explain_clients_news(self, client_id: str) -> List[str]:
+        """
+        Return the stages of the winning plan of the daily news query and
+        warn when it is served by a collection scan.
+        """
+        client_articles_collection = self.connection.get_collection(
+            MONGO_COLLECTION_CLIENT_ARTICLES
+        )
+        plan = client_articles_collection.find(
+            self._clients_news_query(client_id)
+        ).explain()["queryPlanner"]["winningPlan"]
+
+        stages = []
+        while plan:
+            stages.append(plan["stage"])
+            plan = plan.get("inputStage") or plan.get("queryPlan")
+        if "COLLSCAN" in stages:
+            logger.warning(f"Daily news query is a COLLSCAN: {stages}")
+        else:
+            logger.info(f"Daily news query plan: {stages}")
+        return stages
 
     def get_clients_news(
         self,
@@ -88,112 +327,628 @@ class MongoDBServices:
         nlp: bool = False,
         exclude_object_id: bool = False,
     ) -> Optional[List[Dict]]:
-        news_collection = self.connection.get_collection(MONGO_COLLECTION_NEWS)
+        return [
+            article
+            for batch in self.iter_clients_news(
+                client_id=client_id,
+                nlp=nlp,
+                exclude_object_id=exclude_object_id,
+            )
+            for article in batch
+        ]
 
-        start_of_today = datetime.utcnow().replace(
-            hour=0, minute=0, second=0, microsecond=0
-        )
-        end_of_today = start_of_today + timedelta(days=1)
+    def iter_clients_news(
+        self,
+        client_id: str,
+        nlp: bool = False,
+        exclude_object_id: bool = False,
+        batch_size: int = MONGO_STREAM_BATCH_SIZE,
+        with_hash: bool = False,
+        dedup: bool = False,
+    ) -> Iterator[List[Union[Dict, Tuple[str, Dict]]]]:
+        """
+        Stream the daily client`s news in batches of `batch_size` articles
+        instead of loading the whole cursor into memory. With `with_hash`
+        items are (hash, article) pairs, with `dedup` only the first news
+        of every near duplicates cluster is streamed.
+        """
+        news_collection = self.connection.get_collection(MONGO_COLLECTION_NEWS)
 
-        query = {
-            "clients": client_id,
-            "created_at": {"$gte": start_of_today, "$lt": end_of_today},
+        projection = {
+            "article": 1,
+            "hash": 1,
+            "_id": 0 if exclude_object_id else 1,
         }
-        projection = {"article": 1, "_id": 0 if exclude_object_id else 1}
         if nlp:
             projection["sentiment"] = 1
+        if dedup:
+            projection["cluster_id"] = 1
+
+        seen = set()
+        for hashes in self._iter_clients_hashes(client_id, batch_size):
+            docs = list(
+                news_collection.find(
+                    {"hash": {"$in": hashes}},
+                    projection,
+                    batch_size=batch_size,
+                )
+            )
+            if dedup:
+                kept = set(
+                    first_of_clusters(
+                        [doc["hash"] for doc in docs],
+                        {doc["hash"]: doc.get("cluster_id") for doc in docs},
+                        seen,
+                    )
+                )
+                docs = [doc for doc in docs if doc["hash"] in kept]
+            if docs:
+                yield self._articles_batch(
+                    docs, nlp, exclude_object_id, with_hash
+                )
 
-        articles_cursor = news_collection.find(query, projection)
-
+    def _articles_batch(
+        self,
+        docs: List[dict],
+        nlp: bool,
+        exclude_object_id: bool,
+        with_hash: bool,
+    ) -> List[Union[Dict, Tuple[str, Dict]]]:
+        self._attach_contents(docs)
         articles = []
-        for doc in articles_cursor:
-            article_data = doc.get("article", {})
+        for doc in docs:
+            article_data = self._article_data(doc, nlp, exclude_object_id)
+            articles.append(
+                (doc["hash"], article_data) if with_hash else article_data
+            )
+        return articles
 
-            if not exclude_object_id:
-                article_data["_id"] = doc["_id"]
+    def get_contents(self, hashes: List[str]) -> Dict[str, Optional[str]]:
+        """
+        Article bodies by news hash, read from the content collection.
+        """
+        content_collection = self.connection.get_collection(
+            MONGO_COLLECTION_CONTENT
+        )
+        return {
+            doc["_id"]: decode_content(doc)
+            for doc in content_collection.find(
+                {"_id": {"$in": hashes}},
+                {"created_at": 0},
+                batch_size=MONGO_STREAM_BATCH_SIZE,
+            )
+        }
 
-            if nlp:
-                sentiment = doc.get("sentiment", None)
-                if sentiment:
-                    article_data["sentiment"] = sentiment
-            articles.append(article_data)
-        return articles
+    def _attach_contents(self, docs: List[dict]) -> None:
+        # News stored before the content collection still embed the body.
+        missing = [
+            doc["hash"]
+            for doc in docs
+            if "content" not in doc.get("article", {}) and doc.get("hash")
+        ]
+        if not missing:
+            return
+        contents = self.get_contents(missing)
+        for doc in docs:
+            if doc.get("hash") in contents:
+                doc.setdefault("article", {})["content"] = contents[
+                    doc["hash"]
+                ]
+
+    def get_pending_news(
+        self,
+        client_id: Optional[str] = None,
+        hashes: Optional[List[str]] = None,
+    ) -> List[Dict]:
+        """
+        Daily news of the client (or news with the given hashes) whose
+        sentiment is not defined yet. Only `_id` and `hash` of the news and
+        the article bodies are read.
+        """
+        news_collection = self.connection.get_collection(MONGO_COLLECTION_NEWS)
+        if hashes is not None:
+            batches = [hashes]
+        else:
+            batches = self._iter_clients_hashes(
+                client_id, MONGO_STREAM_BATCH_SIZE
+            )
 
-    def update_article_sentiment(
-        self, article_id: ObjectId, sentiment: List
-    ) -> None:
+        docs = []
+        for batch in batches:
+            docs.extend(
+                news_collection.find(
+                    {"hash": {"$in": batch}, "nlp_status": "pending"},
+                    {"article.content": 1, "hash": 1, "cluster_id": 1},
+                    batch_size=MONGO_STREAM_BATCH_SIZE,
+                )
+            )
+        self._attach_contents(docs)
+        return [
+            {
+                "_id": doc["_id"],
+                "hash": doc.get("hash"),
+                "cluster_id": doc.get("cluster_id"),
+                "content": doc.get("article", {}).get("content"),
+            }
+            for doc in docs
+        ]
+
+    def get_clusters_sentiment(
+        self, cluster_ids: List[str], code_word: str
+    ) -> Dict[str, List]:
+        """
+        Sentiment of clusters that already have a news through NLP with
+        the same code word.
+        """
+        news_collection = self.connection.get_collection(MONGO_COLLECTION_NEWS)
+        return {
+            doc["cluster_id"]: doc["sentiment"]
+            for doc in news_collection.find(
+                {
+                    "cluster_id": {"$in": cluster_ids},
+                    "nlp_status": "done",
+                    "nlp_code_word": code_word,
+                },
+                {"cluster_id": 1, "sentiment": 1, "_id": 0},
+            )
+            if "sentiment" in doc
+        }
+
+    def get_news_clusters(self, hashes: List[str]) -> Dict[str, str]:
         news_collection = self.connection.get_collection(MONGO_COLLECTION_NEWS)
-        update_result = news_collection.update_one(
-            {"_id": article_id}, {"$set": {"sentiment": sentiment}}
+        return {
+            doc["hash"]: doc.get("cluster_id")
+            for doc in news_collection.find(
+                {"hash": {"$in": hashes}},
+                {"hash": 1, "cluster_id": 1, "_id": 0},
+                batch_size=MONGO_STREAM_BATCH_SIZE,
+            )
+        }
+
+    def get_clients_news_hashes(
+        self, client_ids: List[str]
+    ) -> Dict[str, List[str]]:
+        """
+        Hashes of the daily news of several clients, read with one query.
+        """
+        client_articles_collection = self.connection.get_collection(
+            MONGO_COLLECTION_CLIENT_ARTICLES
         )
+        hashes = {client_id: [] for client_id in client_ids}
+        for doc in client_articles_collection.find(
+            self._clients_news_query({"$in": client_ids}),
+            {"client_id": 1, "hash": 1, "_id": 0},
+            batch_size=MONGO_STREAM_BATCH_SIZE,
+        ):
+            hashes[doc["client_id"]].append(doc["hash"])
+        return hashes
+
+    def get_news_by_hashes(
+        self,
+        hashes: List[str],
+        nlp: bool = False,
+        exclude_object_id: bool = False,
+    ) -> Dict[str, Dict]:
+        news_collection = self.connection.get_collection(MONGO_COLLECTION_NEWS)
+        projection = {
+            "article": 1,
+            "hash": 1,
+            "_id": 0 if exclude_object_id else 1,
+        }
+        if nlp:
+            projection["sentiment"] = 1
+        docs = list(
+            news_collection.find(
+                {"hash": {"$in": hashes}},
+                projection,
+                batch_size=MONGO_STREAM_BATCH_SIZE,
+            )
+        )
+        self._attach_contents(docs)
+        return {
+            doc["hash"]: self._article_data(doc, nlp, exclude_object_id)
+            for doc in docs
+        }
+
+    def iter_news_by_hashes(
+        self,
+        hashes: List[str],
+        nlp: bool = False,
+        exclude_object_id: bool = False,
+        batch_size: int = MONGO_STREAM_BATCH_SIZE,
+    ) -> Iterator[List[Tuple[str, Dict]]]:
+        """
+        Stream (hash, article) pairs of stored `hashes` in their order,
+        reading `batch_size` articles at a time.
+        """
+        for start in range(0, len(hashes), batch_size):
+            batch = hashes[start : start + batch_size]
+            news = self.get_news_by_hashes(batch, nlp, exclude_object_id)
+            articles = [(key, news[key]) for key in batch if key in news]
+            if articles:
+                yield articles
+
+    @staticmethod
+    def _article_data(doc: dict, nlp: bool, exclude_object_id: bool) -> Dict:
+        article_data = doc.get("article", {})
+
+        if not exclude_object_id:
+            article_data["_id"] = doc["_id"]
 
-        if update_result.modified_count:
-            logger.info(
-                f"Updated article {article_id} with sentiment: {sentiment}"
+        if nlp:
+            sentiment = doc.get("sentiment", None)
+            if sentiment:
+                article_data["sentiment"] = sentiment
+        return article_data
+
+    def update_articles_sentiment(
+        self,
+        sentiments: Dict[ObjectId, List],
+        code_word: Optional[str] = None,
+        flush_size: int = MONGO_BULK_FLUSH_SIZE,
+    ) -> Dict[str, int]:
+        news_collection = self.connection.get_collection(MONGO_COLLECTION_NEWS)
+        fields = {"nlp_status": "done"}
+        if code_word is not None:
+            # Only news processed with the same code word share sentiment.
+            fields["nlp_code_word"] = code_word
+        operations = [
+            UpdateOne(
+                {"_id": article_id},
+                {"$set": {"sentiment": sentiment, **fields}},
             )
-        else:
-            logger.warning(f"No updates made for article {article_id}")
+            for article_id, sentiment in sentiments.items()
+        ]
+
+        counts = {"matched": 0, "modified": 0, "failed": 0}
+        for start in range(0, len(operations), flush_size):
+            chunk = operations[start : start + flush_size]
+            try:
+                result = news_collection.bulk_write(chunk, ordered=False)
+                counts["matched"] += result.matched_count
+                counts["modified"] += result.modified_count
+            except BulkWriteError as bwe:
+                counts["matched"] += bwe.details["nMatched"]
+                counts["modified"] += bwe.details["nModified"]
+                counts["failed"] += len(bwe.details["writeErrors"])
+                logger.error(f"Bulk write error: {bwe.details['writeErrors']}")
+
+        logger.info(
+            f"Updated sentiment for {len(operations)} articles: "
+            f"matched {counts['matched']}, modified {counts['modified']}, "
+            f"failed {counts['failed']}"
+        )
+        return counts
 
 
 class ClusterizationSentences:
     def __init__(self):
-        self.spacy_core_nlp = DependencyManager().spacy_core_nlp
+        self.spacy_core_nlp = DependencyManager().spacy_sentencizer
 
-    def get_clusters(self, article_text: str) -> Optional[List[str]]:
-        doc = self.spacy_core_nlp(article_text)
-        sents = [sent.text for sent in doc.sents]
-        logger.info(f"Count sentences of text: {len(sents)}")
-        return sents
+    def get_code_word_sentences(
+        self,
+        articles: List[Optional[str]],
+        code_word: str,
+        window_size: int = CODE_WORD_WINDOW_SIZE,
+    ) -> List[List[str]]:
+        """
+        Return sentences containing the code word for every article. Only
+        windows of `window_size` characters around case insensitive code
+        word matches are segmented, articles without a match or without
+        content are skipped entirely.
+        """
+        pattern = re.compile(re.escape(code_word), re.IGNORECASE)
+        owners, windows = [], []
+        for idx, article in enumerate(articles):
+            if not article:
+                continue
+            for start, end in self._code_word_windows(
+                article, pattern, window_size
+            ):
+                owners.append(idx)
+                windows.append(article[start:end])
+
+        sentences = [[] for _ in articles]
+        docs = self.spacy_core_nlp.pipe(
+            windows, batch_size=SPACY_PIPE_BATCH_SIZE
+        )
+        for idx, doc in zip(owners, docs):
+            sentences[idx].extend(
+                sent.text for sent in doc.sents if pattern.search(sent.text)
+            )
+        logger.info(
+            f"Segmented {len(windows)} code word windows of "
+            f"{len(set(owners))}/{len(articles)} articles."
+        )
+        return sentences
+
+    @staticmethod
+    def _code_word_windows(
+        text: str, pattern: Pattern, window_size: int
+    ) -> List[Tuple[int, int]]:
+        windows = []
+        for match in pattern.finditer(text):
+            start = max(0, match.start() - window_size)
+            end = min(len(text), match.end() + window_size)
+            if windows and start <= windows[-1][1]:
+                windows[-1] = (windows[-1][0], end)
+            else:
+                windows.append((start, end))
+        return windows
 
 
 class DefineSentiment:
-    def __init__(self):
-        self.model = DependencyManager().model
+    def __init__(self, use_cache: bool = SENTIMENT_CACHE_ENABLED):
+        self.backend = DependencyManager().sentiment_backend
         self.tokenizer = DependencyManager().tokenizer
+        self.cache = SentimentCache() if use_cache else None
+        self.engine = (
+            InferenceEngine(infer=self._infer)
+            if INFERENCE_ENGINE_ENABLED
+            else None
+        )
 
-    def process_text(
-        self, text: str
-    ) -> Literal["positive", "negative", "neutral"]:
-        inputs = self.tokenizer(text, return_tensors="pt")
-
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-
-        logits = outputs.logits
-        probabilities = torch.softmax(logits, dim=-1)
+    def process_batch(
+        self,
+        texts: List[str],
+        batch_size: int = SENTIMENT_BATCH_SIZE,
+        sort_by_length: bool = SENTIMENT_SORT_BY_LENGTH,
+    ) -> List[Literal["positive", "negative", "neutral"]]:
+        """
+        Define sentiment of many texts. Cached sentences are not inferred
+        again and repeated ones are inferred once. Results are returned in
+        the order of the input texts.
+        """
+        if self.cache is None:
+            return self._run(texts, batch_size, sort_by_length)
+
+        keys = [self.cache.key(text) for text in texts]
+        sentiments = self.cache.lookup(list(set(keys)))
+
+        missing = {key: text for key, text in zip(keys, texts)}
+        for key in sentiments:
+            missing.pop(key, None)
+        if missing:
+            inferred = self._run(
+                list(missing.values()), batch_size, sort_by_length
+            )
+            inferred = dict(zip(missing, inferred))
+            self.cache.store(inferred)
+            sentiments.update(inferred)
+        return [sentiments[key] for key in keys]
+
+    def _run(
+        self, texts: List[str], batch_size: int, sort_by_length: bool
+    ) -> List[Literal["positive", "negative", "neutral"]]:
+        if self.engine is not None:
+            # Batched together with sentences of concurrent tasks.
+            return self.engine.submit(texts).result()
+        return self._infer(texts, batch_size, sort_by_length)
+
+    def _infer(
+        self,
+        texts: List[str],
+        batch_size: int = SENTIMENT_BATCH_SIZE,
+        sort_by_length: bool = SENTIMENT_SORT_BY_LENGTH,
+    ) -> List[Literal["positive", "negative", "neutral"]]:
+        """
+        Run sentiment inference with one forward pass per batch.
+        """
+        order = list(range(len(texts)))
+        if sort_by_length:
+            # Neighbouring texts of similar length keep padding per batch low.
+            order.sort(key=lambda idx: len(texts[idx]))
+
+        predicted_sentiments = [None] * len(texts)
+        for start in range(0, len(order), batch_size):
+            batch_indexes = order[start : start + batch_size]
+            labels = self.backend.predict(
+                self.tokenizer, [texts[idx] for idx in batch_indexes]
+            )
+            for idx, label in zip(batch_indexes, labels):
+                predicted_sentiments[idx] = label
 
-        predicted_sentiment = self.model.config.id2label[
-            probabilities.argmax().item()
-        ]
-        return predicted_sentiment
+        logger.info(
+            f"Defined sentiment for {len(texts)} sentences "
+            f"in {-(-len(texts) // batch_size)} batches."
+        )
+        return predicted_sentiments
 
 
 class HttpHook:
-    URL: str = "https://v3-api.newscatcherapi.com/api/search"
-
     def __init__(self):
-        self.newscatcher_client = DependencyManager().newscatcher_client
+        self.newscatcher_fetcher = AsyncNewsCatcherFetcher()
 
     def newscatcher_hook(self, params: dict) -> Dict:
-        response = self.newscatcher_client.get(self.URL, params=params)
-        return response.json()
+        return asyncio.run(self.newscatcher_fetcher.fetch(params))
+
+
+class NewsCatcherFetchCache:
+    """
+    Share one NewsCatcher fetch between clients with the same normalized
+    params inside a NEWSCATCHER_CACHE_BUCKET seconds window. The first
+    client claims the key and fetches, the others wait for its article
+    hashes. Only equal params share a fetch: clients whose source sets
+    merely overlap still fetch separately.
+    """
+
+    def __init__(self, connection: Optional[MongoDBInit] = None):
+        connection = connection or DependencyManager().mongodb_connection
+        self.collection = connection.get_collection(
+            MONGO_COLLECTION_FETCH_CACHE
+        )
+
+    @staticmethod
+    def key(params: dict, now: Optional[float] = None) -> str:
+        time_bucket = int((now or time.time()) // NEWSCATCHER_CACHE_BUCKET)
+        payload = f"{normalize_newscatcher_params(params)}\x1f{time_bucket}"
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get_or_claim(self, key: str) -> Optional[List[str]]:
+        """
+        Return cached article hashes, or None when the caller has to fetch
+        (the key is claimed for it).
+        """
+        deadline = time.monotonic() + NEWSCATCHER_CACHE_WAIT
+        while True:
+            try:
+                self.collection.insert_one(
+                    {
+                        "_id": key,
+                        "status": "pending",
+                        "created_at": datetime.utcnow(),
+                    }
+                )
+                CACHE_LOOKUPS.labels("newscatcher", "miss").inc()
+                return None
+            except DuplicateKeyError:
+                entry = self.collection.find_one({"_id": key})
+
+            if entry and entry["status"] == "ready":
+                logger.info("NewsCatcher fetch served from cache.")
+                CACHE_LOOKUPS.labels("newscatcher", "hit").inc()
+                return entry["hashes"]
+            if time.monotonic() > deadline:
+                logger.warning("Cached NewsCatcher fetch not ready in time.")
+                CACHE_LOOKUPS.labels("newscatcher", "timeout").inc()
+                return None
+            time.sleep(1)
+
+    def store(self, key: str, hashes: List[str]) -> None:
+        self.collection.update_one(
+            {"_id": key},
+            {
+                "$set": {"status": "ready", "hashes": hashes},
+                "$setOnInsert": {"created_at": datetime.utcnow()},
+            },
+            upsert=True,
+        )
+
+    def release(self, key: str) -> None:
+        self.collection.delete_one({"_id": key, "status": "pending"})
+
+
+class DeliveryTracker:
+    """
+    Digests of the news already delivered to a client, kept on its
+    client-news edges. Only news that are new or changed since their last
+    delivery (e.g. got a sentiment) pass `delta`; `commit` records them once
+    the sending succeeded.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        enabled: bool = DELIVERY_DELTA_ENABLED,
+        connection: Optional[MongoDBInit] = None,
+    ):
+        self.client_id = client_id
+        self.enabled = enabled
+        connection = connection or DependencyManager().mongodb_connection
+        self.collection = connection.get_collection(
+            MONGO_COLLECTION_CLIENT_ARTICLES
+        )
+        self.skipped = 0
+        self._pending: Dict[str, str] = {}
+
+    @staticmethod
+    def digest(article: Dict) -> str:
+        return hashlib.sha256(dumps(article, sort_keys=True)).hexdigest()
+
+    def delta(
+        self, batches: Iterable[List[Tuple[str, Dict]]]
+    ) -> Iterator[List[Dict]]:
+        for batch in batches:
+            if not self.enabled:
+                yield [article for _, article in batch]
+                continue
+
+            digests = {key: self.digest(article) for key, article in batch}
+            delivered = {
+                doc["hash"]: doc["digest"]
+                for doc in self.collection.find(
+                    {
+                        "client_id": self.client_id,
+                        "hash": {"$in": list(digests)},
+                        "delivered": True,
+                    },
+                    {"hash": 1, "digest": 1, "_id": 0},
+                )
+            }
+            articles = []
+            for key, article in batch:
+                if delivered.get(key) == digests[key]:
+                    self.skipped += 1
+                    continue
+                articles.append(article)
+                self._pending[key] = digests[key]
+            if articles:
+                yield articles
+
+    def commit(
+        self,
+        undelivered: Iterable[Dict] = (),
+        flush_size: int = MONGO_BULK_FLUSH_SIZE,
+    ) -> None:
+        """
+        Record the pending news as delivered, except the `undelivered`
+        ones the sending strategy did not get accepted.
+        """
+        rejected = {self.digest(article) for article in undelivered}
+        pending = {
+            key: digest
+            for key, digest in self._pending.items()
+            if digest not in rejected
+        }
+        if not pending:
+            return
+        now = datetime.utcnow()
+        operations = [
+            UpdateOne(
+                {"client_id": self.client_id, "hash": key},
+                {
+                    "$set": {
+                        "digest": digest,
+                        "delivered": True,
+                        "delivered_at": now,
+                    },
+                    "$setOnInsert": {"created_at": now},
+                },
+                upsert=True,
+            )
+            for key, digest in pending.items()
+        ]
+        for start in range(0, len(operations), flush_size):
+            self.collection.bulk_write(
+                operations[start : start + flush_size], ordered=False
+            )
+        logger.info(
+            f"Delivery of {len(operations)} news to client_id "
+            f"'{self.client_id}' recorded, {self.skipped} skipped as "
+            f"already delivered."
+        )
+        self._pending = {}
 
 
 class SecretsManager:
     def __init__(self):
         self.boto3_secret_manager = DependencyManager().boto3_secret_manager
 
-    def get_secret(self, client_id: str) -> Optional[Dict]:
+    def get_secret_with_version(
+        self, client_id: str
+    ) -> Tuple[Optional[Dict], Optional[str]]:
         try:
             response = self.boto3_secret_manager.get_secret_value(
                 SecretId=f"clients/{client_id}"
             )
             if "SecretString" in response:
-                return json.loads(response["SecretString"])
+                secret = json.loads(response["SecretString"])
             else:
                 decoded_binary_secret = base64.b64decode(
                     response["SecretBinary"]
                 )
-                return json.loads(decoded_binary_secret)
+                secret = json.loads(decoded_binary_secret)
+            return secret, response.get("VersionId")
         except Exception as e:
             logger.error(f"Error retrieving secret {client_id}: {str(e)}")
+            return None, None
@@ -0,0 +1,39 @@
+import os
+
+import mongomock
+import pytest
+
+# Tests never reach real services, required settings get dummies.
+for name, value in {
+    "CELERY_BACKEND_URL": "cache+memory://",
+    "CELERY_BROKER_URL": "memory://",
+    "NEWSCATCHER_API_KEY": "test",
+    "NEWSCATCHER_RATE_LIMIT": "100000",
+    "SPACY_MODEL_CORE": "en_core_web_sm",
+    "MONGO_COLLECTION_CLIENTS": "clients",
+    "MONGO_COLLECTION_NEWS": "news",
+    "MONGO_DB": "test",
+    "MONGO_HOST": "localhost",
+    "MONGO_PORT": "27017",
+    "MONGO_USER": "test",
+    "MONGO_PASSWORD": "test",
+    "AWS_ACCESS_KEY_ID": "test",
+    "AWS_SECRET_ACCESS_KEY": "test",
+    "AWS_REGION": "us-east-1",
+}.items():
+    os.environ.setdefault(name, value)
+
+
+@pytest.fixture
+def mongo_connection():
+    """
+    MongoDBInit over mongomock installed as the connection of
+    DependencyManager.
+    """
+    from src.db import MongoDBInit
+    from src.dependencies import DependencyManager
+
+    connection = MongoDBInit(mongomock.MongoClient())
+    DependencyManager()._mongodb_connection = connection
+    yield connection
+    DependencyManager()._mongodb_connection = None
@@ -0,0 +1,15 @@
+from src.constants import MONGO_COLLECTION_NEWS
+from src.utils.utils import MongoDBServices
+
+
+def test_cluster_sentiment_reused_only_for_same_code_word(mongo_connection):
+    news = mongo_connection.get_collection(MONGO_COLLECTION_NEWS)
+    news.insert_one({"_id": "a", "cluster_id": "c", "nlp_status": "pending"})
+    services = MongoDBServices(mongo_connection)
+
+    services.update_articles_sentiment({"a": [["positive"]]}, "apple")
+
+    assert services.get_clusters_sentiment(["c"], "apple") == {
+        "c": [["positive"]]
+    }
+    assert services.get_clusters_sentiment(["c"], "tesla") == {}
@@ -0,0 +1,42 @@
+from types import SimpleNamespace
+
+from src.utils.utils import ClusterizationSentences
+
+
+class Sentencizer:
+    """Splits windows into sentences on full stops."""
+
+    def pipe(self, texts, batch_size):
+        for text in texts:
+            yield SimpleNamespace(
+                sents=[
+                    SimpleNamespace(text=sent.strip())
+                    for sent in text.split(".")
+                    if sent.strip()
+                ]
+            )
+
+
+def clusterization():
+    service = ClusterizationSentences.__new__(ClusterizationSentences)
+    service.spacy_core_nlp = Sentencizer()
+    return service
+
+
+def test_windows_are_taken_from_original_text_case_insensitively():
+    # "İ" grows when lowercased, offsets of a lowered copy would drift.
+    article = "İİİİ. Nothing here. Shares of APPLE rose. Weather is fine."
+
+    sentences = clusterization().get_code_word_sentences(
+        [article], "apple", window_size=10
+    )
+
+    assert sentences == [["Shares of APPLE rose"]]
+
+
+def test_articles_without_content_are_skipped():
+    sentences = clusterization().get_code_word_sentences(
+        [None, "Apple rose."], "apple"
+    )
+
+    assert sentences == [[], ["Apple rose"]]
@@ -0,0 +1,108 @@
+from datetime import datetime
+
+import mongomock
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from pymongo.results import BulkWriteResult
+
+from src.constants import (
+    MONGO_COLLECTION_CLIENT_ARTICLES,
+    MONGO_COLLECTION_CONTENT,
+    MONGO_COLLECTION_DELIVERIES,
+    MONGO_COLLECTION_NEWS,
+)
+from src.db import article_hash, bulk_upsert
+
+
+def test_bulk_upsert_returns_indexes_of_inserted_operations():
+    collection = mongomock.MongoClient().db.collection
+    operations = [
+        UpdateOne({"_id": key}, {"$setOnInsert": {"x": 1}}, upsert=True)
+        for key in ("a", "b", "c")
+    ]
+
+    assert bulk_upsert(collection, operations) == [0, 1, 2]
+    assert bulk_upsert(collection, operations) == []
+    assert bulk_upsert(collection, []) == []
+
+
+class ServerCollection:
+    """
+    Replays a MongoDB server reply to bulk_write. mongomock numbers
+    upserted ids by insertion order instead of operation index, so the
+    indexes are checked against the reply shape of a real server.
+    """
+
+    def __init__(self, upserted, write_errors=()):
+        self.details = {
+            "upserted": [{"index": index, "_id": index} for index in upserted],
+            "writeErrors": [
+                {"index": index, "code": 11000} for index in write_errors
+            ],
+        }
+
+    def bulk_write(self, operations, ordered):
+        if self.details["writeErrors"]:
+            raise BulkWriteError(self.details)
+        return BulkWriteResult(self.details, acknowledged=True)
+
+
+def test_bulk_upsert_returns_operation_indexes_with_duplicate_hashes():
+    operations = [
+        UpdateOne({"hash": key}, {"$setOnInsert": {"x": 1}}, upsert=True)
+        for key in ("a", "b", "a", "c")
+    ]
+
+    # The second "a" matches the document inserted by the first one.
+    collection = ServerCollection(upserted=[0, 1, 3])
+    assert bulk_upsert(collection, operations) == [0, 1, 3]
+    # Another worker inserted "b" first.
+    collection = ServerCollection(upserted=[0, 3], write_errors=[1])
+    assert bulk_upsert(collection, operations) == [0, 3]
+
+
+def test_migrations_move_old_news_in_batches(mongo_connection):
+    news = mongo_connection.get_collection(MONGO_COLLECTION_NEWS)
+    created_at = datetime(2024, 1, 1)
+    news.insert_many(
+        [
+            {
+                "article": {
+                    "title": f"title {idx}",
+                    "link": f"https://news/{idx}",
+                    "content": f"body {idx}",
+                },
+                "clients": ["client"],
+                "created_at": created_at,
+            }
+            for idx in range(5)
+        ]
+    )
+    deliveries = mongo_connection.get_collection(MONGO_COLLECTION_DELIVERIES)
+    deliveries.insert_one(
+        {
+            "client_id": "client",
+            "hash": article_hash("title 0", "https://news/0"),
+            "digest": "digest",
+            "created_at": created_at,
+        }
+    )
+
+    mongo_connection.backfill_news_hashes(batch_size=2)
+    mongo_connection.migrate_news_content(batch_size=2)
+    mongo_connection.migrate_client_articles(batch_size=2)
+
+    hashes = [doc["hash"] for doc in news.find()]
+    assert hashes == [
+        article_hash(f"title {idx}", f"https://news/{idx}") for idx in range(5)
+    ]
+    assert news.count_documents({"article.content": {"$exists": True}}) == 0
+    assert news.count_documents({"clients": {"$exists": True}}) == 0
+    contents = mongo_connection.get_collection(MONGO_COLLECTION_CONTENT)
+    assert contents.count_documents({}) == 5
+    edges = mongo_connection.get_collection(MONGO_COLLECTION_CLIENT_ARTICLES)
+    assert edges.count_documents({"client_id": "client"}) == 5
+    assert edges.count_documents({"delivered": True}) == 1
+    assert MONGO_COLLECTION_DELIVERIES not in (
+        news.database.list_collection_names()
+    )
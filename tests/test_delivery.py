@@ -0,0 +1,102 @@
+import json
+
+import pytest
+
+from src.constants import MONGO_COLLECTION_CLIENT_ARTICLES
+from src.tasks import send_articles
+from src.tasks_handlers import sending_handlers
+from src.tasks_handlers.sending_handlers import SQSSendStrategy
+
+
+class SQSClient:
+    """
+    Stubbed SQS client that fails messages holding a rejected title and
+    records the titles of the accepted ones.
+    """
+
+    def __init__(self, rejected=()):
+        self.rejected = rejected
+        self.sent = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        response = {"Successful": [], "Failed": []}
+        for entry in Entries:
+            rejected = any(
+                title in entry["MessageBody"] for title in self.rejected
+            )
+            if rejected:
+                response["Failed"].append({"Id": entry["Id"]})
+            else:
+                response["Successful"].append({"Id": entry["Id"]})
+                self.sent.extend(
+                    doc["title"] for doc in json.loads(entry["MessageBody"])
+                )
+        return response
+
+
+@pytest.fixture
+def strategy(monkeypatch):
+    # Every article is sent in its own message.
+    monkeypatch.setattr(sending_handlers, "SQS_MAX_MESSAGE_SIZE", 1024 + 30)
+    strategy = SQSSendStrategy(
+        client_id="client",
+        credentials={"queue_url": "https://sqs/queue"},
+        credentials_version="v1",
+    )
+    strategy._client = SQSClient()
+    return strategy
+
+
+def articles(*titles):
+    return iter([[(title, {"title": title}) for title in titles]])
+
+
+def delivered(connection):
+    return sorted(
+        doc["hash"]
+        for doc in connection.get_collection(
+            MONGO_COLLECTION_CLIENT_ARTICLES
+        ).find({"client_id": "client", "delivered": True})
+    )
+
+
+def test_rejected_messages_are_not_marked_delivered(
+    mongo_connection, strategy
+):
+    strategy._client.rejected = ("news_b",)
+
+    send_articles(strategy, "client", articles("news_a", "news_b", "news_c"))
+
+    assert delivered(mongo_connection) == ["news_a", "news_c"]
+
+
+def test_oversized_articles_are_not_marked_delivered(
+    mongo_connection, strategy
+):
+    send_articles(strategy, "client", articles("news_a", "news_b" * 100))
+
+    assert delivered(mongo_connection) == ["news_a"]
+
+
+def test_rerun_sends_only_new_and_changed_articles(mongo_connection, strategy):
+    send_articles(strategy, "client", articles("news_a", "news_b"))
+    strategy._client.sent = []
+
+    send_articles(strategy, "client", articles("news_a", "news_b"))
+    assert strategy._client.sent == []
+
+    changed = iter([[("news_a", {"title": "news_a", "rank": 1})]])
+    send_articles(strategy, "client", changed)
+    assert strategy._client.sent == ["news_a"]
+
+
+def test_failed_articles_are_sent_again(mongo_connection, strategy):
+    strategy._client.rejected = ("news_b",)
+    send_articles(strategy, "client", articles("news_a", "news_b"))
+
+    strategy._client.rejected = ()
+    strategy._client.sent = []
+    send_articles(strategy, "client", articles("news_a", "news_b"))
+
+    assert strategy._client.sent == ["news_b"]
+    assert delivered(mongo_connection) == ["news_a", "news_b"]
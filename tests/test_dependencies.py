@@ -0,0 +1,16 @@
+from types import SimpleNamespace
+
+from src import dependencies
+from src.dependencies import DependencyManager
+
+
+def test_sentencizer_load_is_timed(monkeypatch):
+    nlp = SimpleNamespace(
+        pipe_names=["sentencizer"], add_pipe=lambda name: None
+    )
+    monkeypatch.setattr(dependencies, "SPACY_FAST_SEGMENTATION", True)
+    monkeypatch.setattr(dependencies.spacy, "blank", lambda lang: nlp)
+    manager = DependencyManager.__wrapped__()
+
+    assert manager.spacy_sentencizer is nlp
+    assert "spacy_load_seconds" in manager.startup_metrics
@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src import tasks
+from src.constants import MONGO_COLLECTION_CLIENTS
+from src.utils import MongoDBServices
+
+
+@pytest.fixture
+def dispatched(monkeypatch, mongo_connection):
+    """
+    Client ids of the chains enqueued by the dispatcher.
+    """
+    client_ids = []
+
+    class Chain:
+        def __init__(self, ids):
+            self.ids = ids
+
+        def apply_async(self):
+            client_ids.extend(self.ids)
+
+    monkeypatch.setattr(tasks, "build_task_chain", Chain)
+    monkeypatch.setattr(tasks, "PIPELINE_BATCH_MODE", False)
+    monkeypatch.setattr(tasks, "DISPATCH_MAX_CLIENTS", 5)
+    monkeypatch.setattr(tasks, "DISPATCH_MISFIRE_GRACE", 120)
+    return client_ids
+
+
+def add_clients(connection, count: int, next_run_at: datetime) -> None:
+    connection.get_collection(MONGO_COLLECTION_CLIENTS).insert_many(
+        [
+            {
+                "client": f"client_{idx}",
+                "cron": "* * * * *",
+                "scheduled_cron": "* * * * *",
+                "next_run_at": next_run_at,
+                "newscatcher_params": {"q": f"Company{idx}"},
+                "nlp": False,
+                "send_to": "s3_path",
+            }
+            for idx in range(count)
+        ]
+    )
+
+
+def test_backlog_larger_than_page_is_dispatched(mongo_connection, dispatched):
+    now = datetime.now(timezone.utc)
+    MongoDBServices().set_last_dispatch(now - timedelta(minutes=1))
+    add_clients(mongo_connection, 20, now - timedelta(seconds=30))
+
+    tasks.task_dispatch_due_clients()
+
+    assert len(dispatched) == 20
+    assert not MongoDBServices().get_due_clients(now=now, limit=100)
+
+
+def test_late_runs_of_running_dispatcher_fire(mongo_connection, dispatched):
+    # Due long ago but the dispatcher ticked since: late, not missed.
+    now = datetime.now(timezone.utc)
+    MongoDBServices().set_last_dispatch(now - timedelta(minutes=1))
+    add_clients(mongo_connection, 12, now - timedelta(minutes=10))
+
+    tasks.task_dispatch_due_clients()
+
+    assert len(dispatched) == 12
+
+
+def test_runs_missed_while_dispatcher_down_are_skipped(
+    mongo_connection, dispatched
+):
+    now = datetime.now(timezone.utc)
+    MongoDBServices().set_last_dispatch(now - timedelta(hours=1))
+    add_clients(mongo_connection, 12, now - timedelta(minutes=30))
+
+    tasks.task_dispatch_due_clients()
+
+    assert dispatched == []
+    assert not MongoDBServices().get_due_clients(now=now, limit=100)
+
+
+def test_invalid_cron_unschedules_only_its_client(
+    mongo_connection, dispatched
+):
+    now = datetime.now(timezone.utc)
+    MongoDBServices().set_last_dispatch(now - timedelta(minutes=1))
+    add_clients(mongo_connection, 2, now - timedelta(seconds=30))
+    clients = mongo_connection.get_collection(MONGO_COLLECTION_CLIENTS)
+    clients.update_one(
+        {"client": "client_1"},
+        {"$set": {"cron": "not a cron", "scheduled_cron": "not a cron"}},
+    )
+    clients.insert_many(
+        [
+            {"client": "new_valid", "cron": "* * * * *"},
+            {"client": "new_invalid", "cron": "every minute"},
+        ]
+    )
+
+    tasks.task_dispatch_due_clients()
+
+    schedule = {
+        client["client"]: client["next_run_at"] for client in clients.find()
+    }
+    assert dispatched == [str(clients.find_one({"client": "client_0"})["_id"])]
+    assert schedule["client_1"] is None
+    assert schedule["new_invalid"] is None
+    assert schedule["new_valid"].replace(tzinfo=timezone.utc) > now
+    # MongoDB keeps milliseconds of the watermark.
+    assert MongoDBServices().get_last_dispatch() > now - timedelta(seconds=1)
@@ -0,0 +1,26 @@
+import pytest
+
+from src import tasks
+from src.constants import MONGO_COLLECTION_FETCH_CACHE
+from src.utils import MongoDBServices
+
+
+class HttpHook:
+    def newscatcher_hook(self, params):
+        return {"articles": [{"title": "a", "link": "https://news/a"}]}
+
+
+def test_claim_is_released_when_dedup_fails(mongo_connection, monkeypatch):
+    def check_or_add_news(self, client_id, news):
+        raise RuntimeError("MongoDB is down")
+
+    monkeypatch.setattr(tasks, "HttpHook", HttpHook)
+    monkeypatch.setattr(
+        MongoDBServices, "check_or_add_news", check_or_add_news
+    )
+
+    with pytest.raises(RuntimeError):
+        tasks.fetch_news(["client"], {"q": "Apple"})
+
+    fetch_cache = mongo_connection.get_collection(MONGO_COLLECTION_FETCH_CACHE)
+    assert fetch_cache.count_documents({}) == 0
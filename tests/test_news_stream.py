@@ -0,0 +1,66 @@
+from src import tasks
+from src.constants import MONGO_COLLECTION_NEWS
+from src.utils import MongoDBServices
+
+
+def add_news(connection, count: int) -> list:
+    hashes = [f"hash_{idx}" for idx in range(count)]
+    connection.get_collection(MONGO_COLLECTION_NEWS).insert_many(
+        [
+            {
+                "hash": key,
+                "article": {"title": key, "content": "body"},
+                "sentiment": [["Shares rose", "positive"]],
+            }
+            for key in hashes
+        ]
+    )
+    return hashes
+
+
+def test_news_are_read_in_bounded_batches(mongo_connection):
+    hashes = add_news(mongo_connection, 5)
+
+    batches = list(
+        MongoDBServices().iter_news_by_hashes(
+            ["missing"] + hashes[::-1], exclude_object_id=True, batch_size=2
+        )
+    )
+
+    assert [[key for key, _ in batch] for batch in batches] == [
+        ["hash_4"],
+        ["hash_3", "hash_2"],
+        ["hash_1", "hash_0"],
+    ]
+    assert "sentiment" not in batches[0][0][1]
+
+
+def test_batch_send_streams_news_of_every_client(
+    mongo_connection, monkeypatch
+):
+    hashes = add_news(mongo_connection, 3)
+    sent = {}
+
+    def send_articles(strategy, client_id, batches, output=None):
+        sent[client_id] = [
+            article for batch in batches for _, article in batch
+        ]
+
+    monkeypatch.setattr(tasks, "send_articles", send_articles)
+    monkeypatch.setattr(
+        tasks.SendingStrategyFactory,
+        "get_strategy",
+        lambda *args, **kwargs: None,
+    )
+    clients = [
+        {"client_id": "nlp", "nlp": True, "hashes": hashes},
+        {"client_id": "plain", "nlp": False, "hashes": hashes[:1]},
+    ]
+    for client in clients:
+        client.update(send_to="s3_path", output=None)
+
+    tasks.task_send_data_batch.run(clients)
+
+    assert [article["title"] for article in sent["nlp"]] == hashes
+    assert all("sentiment" in article for article in sent["nlp"])
+    assert sent["plain"] == [{"title": "hash_0", "content": "body"}]
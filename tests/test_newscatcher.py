@@ -0,0 +1,62 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src.utils.newscatcher import AsyncNewsCatcherFetcher
+
+
+def fetch_page(responses, max_retries=2):
+    """Fetch one page through a transport replaying `responses` in order."""
+    requests, pauses = [], []
+
+    def handler(request):
+        requests.append(request)
+        response = responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return response
+
+    fetcher = AsyncNewsCatcherFetcher.__wrapped__()
+    fetcher.max_retries = max_retries
+    fetcher.bucket.pause = pauses.append
+
+    async def get():
+        async with httpx.AsyncClient(
+            transport=httpx.MockTransport(handler)
+        ) as client:
+            return await fetcher._get(client, asyncio.Semaphore(1), {"q": "x"})
+
+    return asyncio.run(get()), requests, pauses
+
+
+def page(status=200, **kwargs):
+    return httpx.Response(status, json={"articles": []}, **kwargs)
+
+
+def test_rate_limit_waits_retry_after():
+    result, requests, pauses = fetch_page(
+        [page(429, headers={"Retry-After": "7"}), page()]
+    )
+
+    assert result == {"articles": []}
+    assert len(requests) == 2
+    assert pauses == [7.0]
+
+
+def test_server_errors_and_timeouts_are_retried_with_backoff():
+    result, requests, pauses = fetch_page(
+        [page(503), httpx.ReadTimeout("timed out"), page()]
+    )
+
+    assert result == {"articles": []}
+    assert len(requests) == 3
+    assert pauses == [1.0, 2.0]
+
+
+def test_exhausted_retries_raise():
+    with pytest.raises(httpx.HTTPStatusError):
+        fetch_page([page(503), page(502), page(500)])
+
+    with pytest.raises(httpx.ConnectError):
+        fetch_page([httpx.ConnectError("refused")] * 3)
@@ -0,0 +1,22 @@
+import io
+
+import pyarrow.parquet as pq
+
+from src.output_formats import OutputFormat
+
+
+def test_parquet_keeps_keys_missing_in_the_first_document():
+    docs = [
+        {"title": "a", "link": "https://news/a"},
+        {
+            "title": "b",
+            "link": "https://news/b",
+            "sentiment": [["Shares rose", "positive"]],
+        },
+    ]
+
+    payload = OutputFormat("parquet").encode(docs)
+
+    table = pq.read_table(io.BytesIO(payload))
+    assert table.column_names == ["title", "link", "sentiment"]
+    assert table.to_pylist() == [{**docs[0], "sentiment": None}, docs[1]]
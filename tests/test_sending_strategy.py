@@ -0,0 +1,40 @@
+import pytest
+
+from src.tasks_handlers import sending_handlers
+from src.tasks_handlers.sending_handlers import (
+    S3SendStrategy,
+    SendingStrategyFactory,
+)
+
+
+@pytest.fixture
+def secrets(monkeypatch):
+    calls = []
+
+    class SecretsManager:
+        def get_secret_with_version(self, client_id):
+            # A slow secret fetch must not block other clients.
+            calls.append(SendingStrategyFactory._lock.locked())
+            return {"bucket_name": "bucket"}, "v1"
+
+    monkeypatch.setattr(sending_handlers, "SecretsManager", SecretsManager)
+    monkeypatch.setattr(SendingStrategyFactory, "_cache", {})
+    return calls
+
+
+def test_secret_is_fetched_outside_the_lock(secrets):
+    strategy = SendingStrategyFactory.get_strategy("client", "s3_path")
+
+    assert isinstance(strategy, S3SendStrategy)
+    assert SendingStrategyFactory.get_strategy("client", "s3_path") is strategy
+    assert secrets == [False]
+
+
+def test_cached_strategy_is_not_bound_to_an_output_format(secrets):
+    strategy = SendingStrategyFactory.get_strategy("client", "s3_path")
+
+    parquet = strategy.create_output_format({"format": "parquet"})
+    json = strategy.create_output_format({"format": "json"})
+
+    assert (parquet.format, json.format) == ("parquet", "json")
+    assert not hasattr(strategy, "output_format")
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src import dependencies
+from src.dependencies import DependencyManager
+
+
+class TorchBackend:
+    name = "pytorch"
+
+    def __init__(self, model):
+        self.model = model
+
+
+@pytest.fixture
+def manager(monkeypatch):
+    created = []
+
+    def create_sentiment_backend(name, model, tokenizer, commit):
+        created.append(commit)
+        return SimpleNamespace(name=name)
+
+    monkeypatch.setattr(dependencies, "SENTIMENT_BACKEND", "onnx_int8")
+    monkeypatch.setattr(
+        dependencies, "create_sentiment_backend", create_sentiment_backend
+    )
+    monkeypatch.setattr(dependencies, "TorchBackend", TorchBackend)
+    manager = DependencyManager.__wrapped__()
+    manager._model_path = "/models/hf/snapshots/0123abc"
+    manager._model = object()
+    manager._tokenizer = object()
+    manager.created = created
+    return manager
+
+
+def test_backend_below_parity_falls_back_to_fp32(manager, monkeypatch):
+    monkeypatch.setattr(
+        dependencies, "check_backend_parity", lambda *args: 0.5
+    )
+
+    assert manager.sentiment_backend.name == "pytorch"
+
+
+def test_backend_cache_is_keyed_by_resolved_commit(manager, monkeypatch):
+    monkeypatch.setattr(
+        dependencies, "check_backend_parity", lambda *args: 1.0
+    )
+
+    assert manager.sentiment_backend.name == "onnx_int8"
+    assert manager.created == ["0123abc"]
@@ -0,0 +1,49 @@
+from types import SimpleNamespace
+
+import pytest
+
+from src.dependencies import DependencyManager
+from src.utils.sentiment_cache import SentimentCache
+
+# The decorated class, so that no MongoDB connection is opened.
+cache_class = SentimentCache.__wrapped__
+
+
+@pytest.fixture(autouse=True)
+def model(monkeypatch):
+    """
+    Resolved model snapshot and backend without loading the model.
+    """
+    manager = DependencyManager()
+    monkeypatch.setattr(manager, "_model_path", "/models/snapshots/0123abc")
+    monkeypatch.setattr(
+        manager, "_sentiment_backend", SimpleNamespace(name="onnx_int8")
+    )
+    return manager
+
+
+def test_key_reads_model_of_dependency_manager(model, monkeypatch):
+    key = cache_class.key("Tesla shares rose")
+    monkeypatch.setattr(model, "sentimental_model", "another/model")
+    assert cache_class.key("Tesla shares rose") != key
+
+
+def test_key_changes_with_resolved_model_commit(model, monkeypatch):
+    key = cache_class.key("Tesla shares rose")
+    monkeypatch.setattr(model, "_model_path", "/models/snapshots/4567def")
+    assert cache_class.key("Tesla shares rose") != key
+
+
+def test_key_changes_with_active_backend(model, monkeypatch):
+    # A parity check fallback to fp32 must not write int8 labels.
+    key = cache_class.key("Tesla shares rose")
+    monkeypatch.setattr(
+        model, "_sentiment_backend", SimpleNamespace(name="pytorch")
+    )
+    assert cache_class.key("Tesla shares rose") != key
+
+
+def test_key_ignores_case_and_whitespace():
+    assert cache_class.key("Tesla  shares\nrose") == cache_class.key(
+        "tesla shares rose"
+    )